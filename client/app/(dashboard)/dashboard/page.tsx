@@ -2,19 +2,17 @@
 import { SimpleChart } from "@/components/charts/SimpleChart";
 import CustomChart from "@/components/charts/CustomChart";
 import { useQuery } from "@tanstack/react-query";
+import { fetchStats } from "@/lib/accidents";
 type Props = {};
 
 export default function Page({}: Props) {
   const {
-    data: accidents,
+    data: monthly,
     isLoading,
     error,
   } = useQuery({
-    queryKey: ["accidents"],
-    queryFn: async () => {
-      const response = await fetch("http://127.0.0.1:8080/api/v1/accident/all");
-      return await response.json();
-    },
+    queryKey: ["stats", "by-month"],
+    queryFn: () => fetchStats("by-day", { interval: "month" }),
   });
   return (
     <>
@@ -23,7 +21,11 @@ export default function Page({}: Props) {
       <h2 className="text-xl sm:text-2xl pb-5 font-bold underline">
         Accidents Overview (Per month)
       </h2>
-      {accidents?.datas && <CustomChart datas={accidents?.datas} />}
+      {monthly?.datas && (
+        <CustomChart
+          monthly={monthly.datas.map((item: any) => ({ monthYear: item.key, count: item.count }))}
+        />
+      )}
     </>
   );
 } 
\ No newline at end of file
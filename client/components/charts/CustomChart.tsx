@@ -77,8 +77,9 @@ const CustomizedCross = (props: any) => {
   );
 };
 
-const CustomChart = ({ datas }: any) => {
-  const final = aggregateDataByMonth(datas);
+// Takes either raw accidents (datas) or counts already aggregated by the server (monthly)
+const CustomChart = ({ datas, monthly }: any) => {
+  const final = monthly ?? aggregateDataByMonth(datas);
   return (
     <ResponsiveContainer width="100%" height={500}>
       <LineChart
@@ -12,6 +12,7 @@ import { Accident, OgAccident, makeData } from "@/helpers/makeData";
 import Link from "next/link";
 import { ArrowUpRight } from "lucide-react";
 import { useQuery } from "@tanstack/react-query";
+import { fetchAllAccidents } from "@/lib/accidents";
 
 type Props = {};
 
@@ -22,10 +23,7 @@ export default function OgDataTable({}: Props) {
     error,
   } = useQuery({
     queryKey: ["accidents"],
-    queryFn: async () => {
-      const response = await fetch("http://127.0.0.1:8080/api/v1/accident/all");
-      return await response.json();
-    },
+    queryFn: () => fetchAllAccidents(),
   });
 
   const sortedAccidents = React.useMemo(() => {
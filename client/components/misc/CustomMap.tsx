@@ -1,14 +1,16 @@
 "use client";
 
-import React from "react";
-import { MapContainer, TileLayer, Marker, Popup } from "react-leaflet";
+import React, { useEffect, useState } from "react";
+import { MapContainer, TileLayer, Marker, Popup, CircleMarker, useMapEvents } from "react-leaflet";
 import "leaflet/dist/leaflet.css";
-import { Icon } from "leaflet";
+import { Icon, LatLngBounds } from "leaflet";
+import { fetchAccidentsInBounds } from "@/lib/accidents";
 
 type Props = {
   latitude: number;
   longitude: number;
   address?: string;
+  showNearby?: boolean;
 };
 
 const mapPin = new Icon({
@@ -16,7 +18,37 @@ const mapPin = new Icon({
   iconSize: [25, 35],
 });
 
-export default function CustomMap({ latitude, longitude, address }: Props) {
+// Other accidents in the visible area, reloaded whenever the map is moved or zoomed
+function ViewportAccidents() {
+  const [accidents, setAccidents] = useState<any[]>([]);
+  const load = (bounds: LatLngBounds) =>
+    fetchAccidentsInBounds([bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()])
+      .then((page) => setAccidents(page.datas ?? []))
+      .catch(() => setAccidents([]));
+  const map = useMapEvents({
+    moveend: () => load(map.getBounds()),
+  });
+  useEffect(() => {
+    load(map.getBounds());
+  }, [map]);
+
+  return (
+    <>
+      {accidents.map((accident) => (
+        <CircleMarker key={accident.id} center={[parseFloat(accident.latitude), parseFloat(accident.longitude)]} radius={6}>
+          <Popup>
+            <div>
+              <p>{accident.address || "Accident Location"}</p>
+              <p>{accident.severity}</p>
+            </div>
+          </Popup>
+        </CircleMarker>
+      ))}
+    </>
+  );
+}
+
+export default function CustomMap({ latitude, longitude, address, showNearby = true }: Props) {
   return (
     <div className="overflow-hidden h-[320px] rounded-md border-2">
       <MapContainer
@@ -36,6 +68,7 @@ export default function CustomMap({ latitude, longitude, address }: Props) {
             </div>
           </Popup>
         </Marker>
+        {showNearby && <ViewportAccidents />}
       </MapContainer>
     </div>
   );
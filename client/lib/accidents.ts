@@ -0,0 +1,35 @@
+const ACCIDENTS_URL = "http://127.0.0.1:8080/api/v1/accident/all";
+
+// /all returns one page at a time, this follows nextCursor until every page is loaded.
+// Pass the fields the view needs to keep each page small.
+export async function fetchAllAccidents(fields?: string[], pageSize = 500) {
+  const datas: any[] = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({ limit: String(pageSize) });
+    if (fields) params.set("fields", fields.join(","));
+    if (cursor) params.set("cursor", cursor);
+    const response = await fetch(`${ACCIDENTS_URL}?${params}`);
+    const page = await response.json();
+    datas.push(...(page.datas ?? []));
+    cursor = page.nextCursor ?? null;
+  } while (cursor);
+  return { status: "success", datas };
+}
+
+const WITHIN_URL = "http://127.0.0.1:8080/api/v1/accident/within";
+
+// Accidents inside the map viewport, bounds as [minLng, minLat, maxLng, maxLat]
+export async function fetchAccidentsInBounds(bounds: number[], fields = ["latitude", "longitude", "address", "severity"]) {
+  const params = new URLSearchParams({ bbox: bounds.join(","), fields: fields.join(",") });
+  const response = await fetch(`${WITHIN_URL}?${params}`);
+  return await response.json();
+}
+
+const STATS_URL = "http://127.0.0.1:8080/api/v1/stats";
+
+// Pre-aggregated counts, e.g. fetchStats("by-day", { interval: "month" })
+export async function fetchStats(kind: "by-day" | "by-city" | "by-severity", params: Record<string, string> = {}) {
+  const response = await fetch(`${STATS_URL}/${kind}?${new URLSearchParams(params)}`);
+  return await response.json();
+}
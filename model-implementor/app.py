@@ -1,124 +1,251 @@
+import argparse
 import asyncio
 import numpy as np
 from ultralytics import YOLO
 import cv2
-import cvzone
 import math
+import signal
 import time
-from modules.sort import *
-from services.apis import post_accident_data, send_mail_async_final
+from functools import partial
+from modules.batcher import InferenceBatcher
+from modules.camera import Camera, load_config
+from modules.pipeline import STOP, BoundedQueue, Stage
+from modules.render import Renderer, build_sink
+from services.apis import AlertClient
+from services.outbox import Outbox
 from geopy.geocoders import Nominatim
-from modules.send_mail_async import send_mail_async
-import base64
 
-# Importing the model
-model = YOLO('models/i1-yolov8s.pt')
-# model = YOLO('models/current.pt')
-
-# Importing the video
-cap = cv2.VideoCapture("./assets/car-crash.mov")
-
-
-async def main():
-    emailDebounceTime = 5  # Time in seconds to wait before sending another email
-    imageSaveDebounceTime = 5
-    isSendMail = False
-
-    # Implementing Tracker Code...
-    tracker = Sort(max_age=20, min_hits=3, iou_threshold=0.3)
-    totalAccidents = []
-    tempConf = 0
-    lastEmailSentTime = 0
-    lastImageSavedTime = 0
-    imageCount = 0
-    task = None
+CONFIG_PATH = "./assets/cameras.json"
+
+# Queue sizes and overflow policies between the stages:
+# capture -> frames -> infer -> detections -> track -> alerts / render
+QUEUE_DEFAULTS = {
+    "frames": {"size": 16, "policy": "drop_oldest"},
+    "detections": {"size": 16, "policy": "block"},
+    "alerts": {"size": 64, "policy": "block"},
+    "render": {"size": 4, "policy": "drop_oldest"},
+}
+
+
+def get_detections(camera, r):
+    detections = np.empty((0, 5))
+    for box in r.boxes:
+        x1, y1, x2, y2 = box.xyxy[0]
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+
+        conf = math.ceil((box.conf[0] * 100)) / 100
+        camera.tempConf = conf
+
+        if float(conf) > 0.4:
+            currentArray = np.array([x1, y1, x2, y2, conf])
+            detections = np.vstack((detections, currentArray))
+    return detections
+
+
+def track_frame(frame, alerts):
+    """
+    Track stage: runs the camera's Sort tracker and queues an alert for every new track id.
+    """
+    camera = frame.camera
+    if not frame.infer:
+        # the Kalman prediction carries the tracks over frames the motion gate skipped
+        frame.detections = np.empty((0, 5))
+        frame.tracks = camera.tracker.predict()
+        return frame
+    frame.detections = get_detections(camera, frame.result)
+    frame.tracks = camera.tracker.update(frame.detections)
+    for result in frame.tracks:
+        id = int(result[4])
+        if id not in camera.totalAccidents:
+            camera.totalAccidents.add(id)
+            alerts.put((frame, result, camera.tempConf))
+    return frame
+
+
+def encode_snapshot(img, box, quality=80, maxWidth=None, crop=False, cropMargin=1.0):
+    """
+    JPEG-encodes the alert snapshot and returns the encoded buffer. With crop only the
+    tracked box, grown by cropMargin times its size on every side, is kept. Images wider
+    than maxWidth are scaled down.
+    """
+    if crop:
+        height, width = img.shape[:2]
+        x1, y1, x2, y2 = box[:4]
+        marginX, marginY = (x2 - x1) * cropMargin, (y2 - y1) * cropMargin
+        x1, y1 = max(0, int(x1 - marginX)), max(0, int(y1 - marginY))
+        x2, y2 = min(width, int(x2 + marginX)), min(height, int(y2 + marginY))
+        if x2 > x1 and y2 > y1:
+            img = img[y1:y2, x1:x2]
+    if maxWidth and img.shape[1] > maxWidth:
+        scale = maxWidth / float(img.shape[1])
+        img = cv2.resize(img, (int(maxWidth), int(round(img.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buffer
+
+
+def dispatch_alert(alert, client, snapshot=None):
+    """
+    Alert stage: hands the accident record and the alert email to the shared client without waiting on either.
+    The snapshot goes along as raw JPEG bytes, `snapshot` holds the encode_snapshot options.
+    """
+    frame, track, conf = alert
+    getLoc = frame.camera.getLoc
+    if getLoc is None:
+        return
+    frame_encoded = encode_snapshot(frame.img, track, **(snapshot or {}))
+    data = {
+        "address": getLoc.address,
+        "city": getLoc.raw.get("address", {}).get("city"),
+        "latitude": getLoc.latitude,
+        "longitude": getLoc.longitude,
+        "severityInPercentage": conf * 100,
+        "severity": "Moderate"
+    }
+    client.send_mail(getLoc.latitude, getLoc.longitude, str(conf * 100), getLoc.address)
+    # the encoder's buffer is handed over as is, without a base64 round trip
+    client.post_accident(data, frame_encoded.data)
+
+
+def build_queues(config, queuePolicy=None):
+    queues = {}
+    for name, defaults in QUEUE_DEFAULTS.items():
+        options = dict(defaults, **config.get("queues", {}).get(name, {}))
+        if name == "frames" and queuePolicy:
+            options["policy"] = queuePolicy
+        queues[name] = BoundedQueue(name, maxsize=options["size"], policy=options["policy"])
+    return queues
+
+
+def print_metrics(cameras, stages, services=None):
+    for camera in cameras:
+        print(f"[metrics] capture {camera.name}:", camera.metrics.summary())
+        if camera.gate is not None:
+            print(f"[metrics] motion gate {camera.name}:", camera.gate.summary())
+    for stage in stages:
+        print(f"[metrics] {stage.name}:", stage.summary())
+    for name, service in (services or {}).items():
+        if service is not None:
+            print(f"[metrics] {name}:", service.summary())
+
+
+def stop_on_signals(cameras):
+    """
+    SIGINT (Ctrl-C) and SIGTERM stop the cameras, so the end of the stream goes through the
+    pipeline and the queued alerts are delivered. A second signal interrupts as usual.
+    """
+    loop = asyncio.get_running_loop()
+
+    def stop(signum):
+        print(f"Received {signal.Signals(signum).name}, stopping the cameras")
+        for camera in cameras:
+            camera.stop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop, sig)
+        except NotImplementedError:
+            # Windows, Ctrl-C cancels main() instead, which still runs its cleanup
+            pass
+
+
+async def watch_cameras(cameras, frames):
+    # once every camera has stopped, push the end of the stream through the pipeline
+    while any(camera.running for camera in cameras):
+        await asyncio.sleep(0.1)
+    frames.put(STOP)
+
+
+async def report_metrics(cameras, stages, services, interval):
+    lastReportTime = time.time()
+    while any(stage.running for stage in stages):
+        await asyncio.sleep(0.1)
+        if time.time() - lastReportTime >= interval:
+            lastReportTime = time.time()
+            print_metrics(cameras, stages, services)
+
+
+async def main(configPath=CONFIG_PATH, batchSize=None, batchDeadlineMs=None, queuePolicy=None, headless=None, statsInterval=10):
+    config = load_config(configPath)
+    queues = build_queues(config, queuePolicy)
+
+    # One model instance shared by every camera
+    model = YOLO(config.get("model", "models/i1-yolov8s.pt"))
+    batcher = InferenceBatcher(
+        model, queues["frames"], queues["detections"],
+        maxBatchSize=batchSize or config.get("batchSize", 8),
+        maxDelay=(batchDeadlineMs if batchDeadlineMs is not None else config.get("batchDeadlineMs", 20)) / 1000.0,
+    )
 
     location = Nominatim(user_agent="iteration1-accident-detection-system", timeout=10)
-    getLoc = location.reverse("28.236758299999998, 83.9960459255522")
-
-    print(getLoc.raw)
-    while True:
-        success, img = cap.read()
-        results = model(img, stream=True)
-        detections = np.empty((0, 5))
-
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                w, h = x2 - x1, y2 - y1
-
-                conf = math.ceil((box.conf[0] * 100)) / 100
-                tempConf = conf
-
-                if float(tempConf) > 0.4:
-                    cvzone.cornerRect(img, (x1, y1, w, h))
-                    cvzone.putTextRect(img, f'Accident {conf}', (max(0, x1), max(35, y1)), colorR=(0, 165, 255))
-                    currentArray = np.array([x1, y1, x2, y2, conf])
-                    detections = np.vstack((detections, currentArray))
-
-                    # if (time.time() - lastEmailSentTime) > emailDebounceTime and isSendMail == False:
-                    #     lastEmailSentTime = time.time()
-                    #     isSendMail = True
-                    #     task = asyncio.create_task(send_mail_async())
-
-        trackerResults = tracker.update(detections)
-
-        for result in trackerResults:
-            x1,y1,x2,y2,id = result
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-            id = int(id)
-            w, h = x2 - x1, y2 - y1
-            if totalAccidents.count(id) == 0:
-
-                if getLoc is not None:
-                    # pass
-                    _, frame_encoded = cv2.imencode('.jpg', img)
-                    frame_base64 = base64.b64encode(frame_encoded).decode('utf-8')
-                    data = {
-                        "address": getLoc.address,
-                        "city": getLoc.raw.get("address", {}).get("city"),
-                        "latitude": getLoc.latitude,
-                        "longitude": getLoc.longitude,
-                        "severityInPercentage": tempConf * 100,
-                        "severity": "Moderate",
-                        "frame": frame_base64
-                    }
-                    task = asyncio.create_task(send_mail_async_final(getLoc.latitude, getLoc.longitude, str(tempConf * 100), getLoc.address))
-                    task1 = asyncio.create_task(post_accident_data(data))
-                    # if response.status_code == 200:
-                    #     print("Request successful. 🔥🔥🔥🔥🔥")
-                    #     print(response.json())
-                    # else:
-                    #     print(f"Error ❌❌❌❌❌❌: {response.status_code}\n{response.text}")
-                cvzone.cornerRect(img, (x1, y1, w, h), colorR=(255, 0, 255))
-                cvzone.putTextRect(img, f'{id}', (max(0, x1), max(35, y1)))
-                cx, cy = x1 + w // 2, y1 + h // 2
-                cv2.circle(img, (cx, cy), 5, (255, 0, 255), cv2.FILLED)
-                totalAccidents.append(id)
-
-        # if(float(tempConf) > 0.4):
-        #     if (time.time() - lastEmailSentTime) > emailDebounceTime and isSendMail == False:
-        #         lastEmailSentTime = time.time()
-        #         send_mail()
-        #         isSendMail = True
-
-        # Displaying the video
-        cv2.imshow("Video Capture", img)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-        await asyncio.sleep(0.01)
-
-    if task & task1 is not None:
-        await task, task1
-    # if task is not None:
-    #     await task
-
-if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
+    # the top level "motion" block is the default for every camera, null disables gating
+    cameras = [Camera(**dict({"motion": config.get("motion")}, **cameraConfig)) for cameraConfig in config["cameras"]]
+    for camera in cameras:
+        getLoc = camera.locate(location)
+        print(camera.name, getLoc.raw if getLoc is not None else None)
+
+    # Headless boxes skip drawing entirely unless an output sink asks for annotated frames
+    display = not headless if headless is not None else config.get("display", True)
+    renderer = Renderer(cameras, display=display, sink=build_sink(config.get("output")))
+
+    # "alerts": {"concurrency", "retries", "backoff", "batchSize", "batchDelay"}, see services/apis.py
+    alertClient = AlertClient(**config.get("alerts", {}))
+    # with an outbox the alert stage only appends to it and a drainer delivers the alerts,
+    # "outbox": null sends them straight from the alert stage
+    outbox = Outbox(**config["outbox"]) if config.get("outbox") else None
+    services = {"alert client": alertClient, "outbox": outbox}
+    trackStage = Stage("track", queues["detections"], partial(track_frame, alerts=queues["alerts"]),
+                       outbox=queues["render"] if renderer.enabled else None, onStop=lambda: queues["alerts"].put(STOP))
+    alertStage = Stage("alerts", queues["alerts"], partial(dispatch_alert, client=outbox or alertClient, snapshot=config.get("snapshot")))
+    renderStage = Stage("render", queues["render"], renderer, onStop=renderer.close)
+    stages = [batcher, trackStage, alertStage] + ([renderStage] if renderer.enabled else [])
+
+    batcher.start()
+    trackStage.start()
+    if renderer.sink is not None:
+        renderer.sink.start()
+    for camera in cameras:
+        camera.start(queues["frames"])
+    stop_on_signals(cameras)
+
+    drainTask = asyncio.create_task(outbox.drain(alertClient)) if outbox is not None else None
+    startTime = time.time()
     try:
-        loop.run_until_complete(main())
+        # alert dispatch and the GUI stay on the main thread's event loop
+        await asyncio.gather(
+            watch_cameras(cameras, queues["frames"]),
+            alertStage.run_async(),
+            report_metrics(cameras, stages, services, statsInterval),
+            *([renderStage.run_async()] if renderer.enabled else []),
+        )
     finally:
-        loop.close()
\ No newline at end of file
+        for camera in cameras:
+            camera.stop()
+        elapsed = time.time() - startTime
+        framesProcessed = trackStage.metrics.processed
+        print("Processed %d frames from %d cameras in %.1fs (%.1f FPS)" % (framesProcessed, len(cameras), elapsed, framesProcessed / max(elapsed, 1e-6)))
+        print_metrics(cameras, stages, services)
+        print("[metrics] render: drawn %d, skipped %d" % (renderer.drawn, renderer.skipped))
+
+        # let queued alerts reach the server before the process exits
+        if outbox is not None:
+            await outbox.stop(drainTask)
+            outbox.close()
+        await alertClient.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Multi-camera accident detection service')
+    parser.add_argument("--config", help="Path to the cameras config file.", type=str, default=CONFIG_PATH)
+    parser.add_argument("--batch_size", help="Maximum number of frames per inference batch.", type=int, default=None)
+    parser.add_argument("--batch_deadline_ms", help="Longest a queued frame waits for its batch to fill.", type=float, default=None)
+    parser.add_argument("--queue_policy", help="What capture does when inference falls behind.", choices=["drop_oldest", "block"], default=None)
+    parser.add_argument("--headless", help="Never open a window or draw for one [config 'display'].", action="store_true", default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # asyncio.run cancels main() on an unhandled Ctrl-C, so its cleanup still runs on the loop
+    asyncio.run(main(args.config, args.batch_size, args.batch_deadline_ms, args.queue_policy, args.headless))
@@ -0,0 +1,106 @@
+"""
+Dense vs gated association crossover benchmark.
+
+Runs Sort over synthetic scenes of growing object count (see sort_bench.py for the
+generator), records every association it performs and replays each one through
+associate_detections_to_trackers with gated=False and gated=True. Both must give
+identical matches and unmatched detections (their order decides the new track IDs)
+and the same set of unmatched trackers, also for integer boxes (app.py int-casts every
+YOLO box) with some of them duplicated, which makes IOUs tie exactly. The table shows
+where gating starts to pay off, in detection x tracker pairs per frame, which is what
+Sort's association='auto' switches on (modules.sort.GATED_MIN_PAIRS). The exit code is 1
+when GATED_MIN_PAIRS is below the measured crossover.
+
+    python benchmarks/association_bench.py --objects 10 40 80 120 160 320
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sort_bench import generate_scene, run_tracker, sort  # noqa: E402
+
+
+def integer_boxes(stream, duplicates, seed):
+    """
+    Rounds the boxes down to whole pixels like app.py and repeats a `duplicates` share of
+    the detections of every frame, in a random position.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for dets in stream:
+        dets = dets.copy()
+        dets[:, :4] = dets[:, :4].astype(int)
+        dets = np.vstack((dets, dets[rng.random(len(dets)) < duplicates]))
+        frames.append(dets[rng.permutation(len(dets))])
+    return frames
+
+
+def check_equal(stream, label):
+    calls = []
+    run_tracker(stream, association="dense", record=calls)
+    calls = [call for call in calls if len(call[0]) and len(call[1])]
+    for detections, trackers, iou_threshold, *_ in calls:
+        dense = sort.associate_detections_to_trackers(detections, trackers, iou_threshold, False)
+        gated = sort.associate_detections_to_trackers(detections, trackers, iou_threshold, True)
+        same = np.array_equal(dense[0], gated[0]) and np.array_equal(dense[1], gated[1])
+        if not same or not np.array_equal(np.sort(dense[2]), np.sort(gated[2])):
+            sys.exit("gated association differs from dense with %s" % label)
+    return calls
+
+
+def time_calls(calls, gated, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        startTime = time.perf_counter()
+        for detections, trackers, iou_threshold, *_ in calls:
+            sort.associate_detections_to_trackers(detections, trackers, iou_threshold, gated)
+        best = min(best, time.perf_counter() - startTime)
+    return best / len(calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dense vs gated association crossover")
+    parser.add_argument("--objects", type=int, nargs="+", default=[10, 40, 80, 120, 160, 320])
+    parser.add_argument("--density", type=float, default=30, help="Objects per megapixel.")
+    parser.add_argument("--occlusion", type=float, default=0.1)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Share of integer boxes repeated in the duplicate check.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("%8s %10s %12s %12s %8s" % ("objects", "pairs", "dense us", "gated us", "speedup"))
+    rows = []
+    for objects in args.objects:
+        stream = generate_scene(objects=objects, density=args.density, occlusion=args.occlusion,
+                                falsePositives=objects / 20.0, frames=args.frames, seed=args.seed)
+        calls = check_equal(stream, "%d objects" % objects)
+        check_equal(integer_boxes(stream, 0, args.seed), "%d objects, integer boxes" % objects)
+        check_equal(integer_boxes(stream, args.duplicates, args.seed), "%d objects, duplicate boxes" % objects)
+
+        pairs = np.mean([len(call[0]) * len(call[1]) for call in calls])
+        denseTime = time_calls(calls, False, args.repeat)
+        gatedTime = time_calls(calls, True, args.repeat)
+        speedup = denseTime / gatedTime
+        rows.append((pairs, speedup))
+        print("%8d %10.0f %12.1f %12.1f %7.2fx" % (objects, pairs, denseTime * 1e6, gatedTime * 1e6, speedup))
+
+    # the crossover is where gating wins from then on, not the first lucky win
+    crossover = None
+    for pairs, speedup in reversed(rows):
+        if speedup <= 1:
+            break
+        crossover = pairs
+    if crossover is None:
+        print("\nGating never won in this range.")
+    else:
+        print("\nGating wins from about %.0f pairs per frame (GATED_MIN_PAIRS is %d)." % (crossover, sort.GATED_MIN_PAIRS))
+        if sort.GATED_MIN_PAIRS < crossover:
+            sys.exit("GATED_MIN_PAIRS is below the measured crossover, raise it")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Cold-start import benchmark for the tracker.
+
+Every measurement is the wall time of a fresh interpreter that only performs the
+import, so it is the full cold start a detector process pays. "lean" is
+`from modules.sort import Sort` as the detector does it; "with display" adds the
+matplotlib/skimage demo module that sort.py used to load unconditionally.
+
+    python benchmarks/import_time.py --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    "interpreter": "pass",
+    "lean (modules.sort)": "from modules.sort import Sort",
+    "with display (modules.sort + modules.sort_display)": "import modules.sort, modules.sort_display",
+}
+
+
+def time_import(stmt):
+    startTime = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", stmt], cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - startTime
+    if out.returncode != 0:
+        return None, out.stderr.strip().splitlines()[-1]
+    return elapsed, None
+
+
+def slowest_imports(stmt, top):
+    """
+    Returns the `top` slowest modules from `python -X importtime`, as (cumulative us, module).
+    """
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", stmt], cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracker import-time benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per case.")
+    parser.add_argument("--top", type=int, default=8, help="Slowest modules to list for the lean import.")
+    args = parser.parse_args()
+
+    results = {}
+    for name, stmt in CASES.items():
+        samples = []
+        for _ in range(args.repeat):
+            elapsed, error = time_import(stmt)
+            if error:
+                print("%-55s unavailable: %s" % (name, error))
+                break
+            samples.append(elapsed)
+        if samples:
+            results[name] = statistics.median(samples)
+            print("%-55s median %8.1f ms  (min %.1f, max %.1f)" % (name, results[name] * 1000, min(samples) * 1000, max(samples) * 1000))
+
+    lean, heavy = results.get("lean (modules.sort)"), results.get("with display (modules.sort + modules.sort_display)")
+    if lean and heavy:
+        print("\nLean import saves %.1f ms per process (%.1fx faster)" % ((heavy - lean) * 1000, heavy / lean))
+
+    print("\nSlowest modules behind `import modules.sort`:")
+    for cumulative, name in slowest_imports(CASES["lean (modules.sort)"], args.top):
+        print("  %8.1f ms  %s" % (cumulative / 1000, name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Benchmark suite for the Sort tracker on synthetic detection streams.
+
+Each scenario generates objects moving across a scene with a constant-velocity
+motion model plus jitter. Density sets the scene size (objects per megapixel),
+occlusion is the chance that an object is missed in a given frame, and false
+positives are sprinkled in at random. No MOT data is needed.
+
+For every scenario it reports per-frame latency percentiles of Sort.update, and
+separately of associate_detections_to_trackers and iou_batch replayed on the
+exact inputs Sort saw, plus the peak memory traced during one run. Each timing
+is the fastest of --repeat runs.
+
+    python benchmarks/sort_bench.py                           # all scenarios
+    python benchmarks/sort_bench.py --save benchmarks/baselines/sort.json
+    python benchmarks/sort_bench.py --compare benchmarks/baselines/sort.json
+
+With --compare the exit code is 1 when a p50 or p99 regresses by more than
+--tolerance, so it can gate CI. Baselines are machine specific, regenerate them
+on the box that runs the comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import sort  # noqa: E402
+
+SCENARIOS = {
+    "sparse": {"objects": 10, "density": 5, "occlusion": 0.05, "falsePositives": 0.5},
+    "busy": {"objects": 60, "density": 30, "occlusion": 0.1, "falsePositives": 2},
+    "crowded": {"objects": 200, "density": 80, "occlusion": 0.2, "falsePositives": 5},
+}
+
+
+def generate_scene(objects=50, density=20, occlusion=0.1, falsePositives=1, frames=300, seed=0):
+    """
+    Returns a list with one (N,5) [x1,y1,x2,y2,score] detection array per frame.
+    """
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(objects / float(density) * 1e6)
+    pos = rng.uniform(0, side, (objects, 2))
+    vel = rng.normal(0, 3, (objects, 2))
+    size = rng.uniform(30, 120, (objects, 2))
+    stream = []
+    for _ in range(frames):
+        pos += vel
+        # objects leaving the scene are replaced by new ones entering elsewhere
+        gone = np.any((pos < -size) | (pos > side), axis=1)
+        pos[gone] = rng.uniform(0, side, (gone.sum(), 2))
+        vel[gone] = rng.normal(0, 3, (gone.sum(), 2))
+        visible = rng.random(objects) >= occlusion
+        xy = pos[visible] + rng.normal(0, 2, (visible.sum(), 2))
+        wh = size[visible] * (1 + rng.normal(0, 0.05, (visible.sum(), 2)))
+        dets = np.hstack((xy, xy + wh, rng.uniform(0.4, 1, (visible.sum(), 1))))
+        extra = rng.poisson(falsePositives)
+        if extra:
+            fxy = rng.uniform(0, side, (extra, 2))
+            fwh = rng.uniform(30, 120, (extra, 2))
+            dets = np.vstack((dets, np.hstack((fxy, fxy + fwh, rng.uniform(0.4, 0.6, (extra, 1))))))
+        stream.append(dets)
+    return stream
+
+
+def latency_summary(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "meanMs": float(samples.mean()),
+        "p50Ms": float(np.percentile(samples, 50)),
+        "p90Ms": float(np.percentile(samples, 90)),
+        "p99Ms": float(np.percentile(samples, 99)),
+        "maxMs": float(samples.max()),
+    }
+
+
+def run_tracker(stream, max_age=20, min_hits=3, iou_threshold=0.3, association='auto', record=None):
+    """
+    Runs Sort over the stream and returns the per-frame update latencies. When `record`
+    is a list, the arguments of every association Sort runs are appended to it.
+    """
+    associate = sort.associate_detections_to_trackers
+    if record is not None:
+        def recording(*args):
+            record.append(args)
+            return associate(*args)
+        sort.associate_detections_to_trackers = recording
+    try:
+        tracker = sort.Sort(max_age=max_age, min_hits=min_hits, iou_threshold=iou_threshold, association=association)
+        latencies = []
+        for dets in stream:
+            startTime = time.perf_counter()
+            tracker.update(dets)
+            latencies.append(time.perf_counter() - startTime)
+        return latencies
+    finally:
+        sort.associate_detections_to_trackers = associate
+
+
+def replay(calls, fn):
+    latencies = []
+    for args in calls:
+        startTime = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - startTime)
+    return latencies
+
+
+def best_of(runs):
+    """
+    Combines the latency summaries of repeated runs by keeping the fastest value of
+    every statistic, which filters out most scheduler noise.
+    """
+    if not runs[0]:
+        return None
+    return {key: min(run[key] for run in runs) for key in runs[0]}
+
+
+def bench_scenario(name, options, frames, seed, repeat=3, warmup=20):
+    stream = generate_scene(frames=frames, seed=seed, **options)
+    run_tracker(stream[:warmup])
+
+    updates, association, iou = [], [], []
+    for _ in range(repeat):
+        calls = []
+        updates.append(latency_summary(run_tracker(stream, record=calls)))
+        association.append(latency_summary(replay(calls, sort.associate_detections_to_trackers)) if calls else None)
+        iou.append(latency_summary(replay([args[:2] for args in calls], sort.iou_batch)) if calls else None)
+
+    tracemalloc.start()
+    run_tracker(stream)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "options": options,
+        "frames": frames,
+        "meanDetections": float(np.mean([len(d) for d in stream])),
+        "meanTracks": float(np.mean([len(args[1]) for args in calls])) if calls else 0.0,
+        "update": best_of(updates),
+        "associate": best_of(association),
+        "iou_batch": best_of(iou),
+        "peakMemoryKiB": peak / 1024.0,
+    }
+
+
+def compare(results, baseline, tolerance, minDeltaMs):
+    """
+    Prints p50/p99 changes against the baseline and returns the list of regressions: a
+    statistic that got slower by more than `tolerance` and by at least `minDeltaMs`.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for part in ("update", "associate", "iou_batch"):
+            if not result.get(part) or not base.get(part):
+                continue
+            for stat in ("p50Ms", "p99Ms"):
+                before, after = base[part][stat], result[part][stat]
+                change = (after - before) / before if before else 0.0
+                flag = "REGRESSION" if change > tolerance and after - before >= minDeltaMs else ""
+                print("  %-10s %-10s %s %8.3f ms -> %8.3f ms (%+6.1f%%) %s" % (name, part, stat[:3], before, after, change * 100, flag))
+                if flag:
+                    regressions.append((name, part, stat, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sort benchmark suite")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run, repeatable [all].")
+    parser.add_argument("--frames", type=int, default=500, help="Frames per scenario.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per scenario, the fastest of each statistic is kept.")
+    parser.add_argument("--save", help="Write the results as a JSON baseline to this path.")
+    parser.add_argument("--compare", help="Compare p50/p99 latencies against this JSON baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before failing [0.25].")
+    parser.add_argument("--min_delta_ms", type=float, default=0.05, help="Ignore slowdowns smaller than this [0.05 ms].")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        result = bench_scenario(name, SCENARIOS[name], args.frames, args.seed, repeat=args.repeat)
+        results[name] = result
+        print("%-8s dets/frame %6.1f  tracks/frame %6.1f  peak %8.1f KiB" % (name, result["meanDetections"], result["meanTracks"], result["peakMemoryKiB"]))
+        for part in ("update", "associate", "iou_batch"):
+            if result[part]:
+                print("  %-10s p50 %8.3f  p90 %8.3f  p99 %8.3f  max %8.3f ms" % (part, result[part]["p50Ms"], result[part]["p90Ms"], result[part]["p99Ms"], result[part]["maxMs"]))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                       "frames": args.frames, "seed": args.seed, "scenarios": results}, f, indent=2)
+        print("Saved baseline to %s" % args.save)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("Compared with %s:" % args.compare)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("%d regression(s) above %.0f%%" % (len(regressions), args.tolerance * 100))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
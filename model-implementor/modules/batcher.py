@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+from modules.pipeline import STOP, percentile
+
+
+class BatchStats(object):
+    """
+    Rolling per-batch timings, kept over the last `window` batches.
+    """
+
+    def __init__(self, window=1000):
+        self.batches = 0
+        self.frames = 0
+        self.failures = 0
+        self.sizes = deque(maxlen=window)
+        self.inferTimes = deque(maxlen=window)
+        self.waitTimes = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, size, inferTime, waitTime, latencies):
+        with self._lock:
+            self.batches += 1
+            self.frames += size
+            self.sizes.append(size)
+            self.inferTimes.append(inferTime)
+            self.waitTimes.append(waitTime)
+            self.latencies.extend(latencies)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def summary(self):
+        with self._lock:
+            batches, frames, failures = self.batches, self.frames, self.failures
+            sizes, infer, wait, latency = list(self.sizes), list(self.inferTimes), list(self.waitTimes), list(self.latencies)
+        return {
+            "batches": batches,
+            "frames": frames,
+            "failures": failures,
+            "meanBatchSize": sum(sizes) / len(sizes) if sizes else 0.0,
+            "inferMsP50": percentile(infer, 50) * 1000,
+            "inferMsP99": percentile(infer, 99) * 1000,
+            "fillWaitMsP99": percentile(wait, 99) * 1000,
+            "captureToResultMsP50": percentile(latency, 50) * 1000,
+            "captureToResultMsP99": percentile(latency, 99) * 1000,
+        }
+
+
+class InferenceBatcher(object):
+    """
+    Micro-batching scheduler for the shared model.
+
+    Frames from every camera are queued on `inbox`. A batch is flushed when it
+    holds `maxBatchSize` frames or when `maxDelay` seconds have passed since its
+    first frame was captured, whichever comes first. Each frame is forwarded to
+    `outbox` with its result attached, in the order it was submitted, so it can
+    be handed to its own camera's tracker. Frames the motion gate skipped pass
+    straight through, still in order, without counting towards a batch.
+    """
+
+    name = "infer"
+
+    def __init__(self, model, inbox, outbox, maxBatchSize=8, maxDelay=0.02):
+        self.model = model
+        self.inbox = inbox
+        self.outbox = outbox
+        self.maxBatchSize = max(1, int(maxBatchSize))
+        self.maxDelay = max(0.0, float(maxDelay))
+        self.stats = BatchStats()
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="stage-infer", daemon=True)
+        self._thread.start()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _collect(self):
+        """
+        Returns the next batch and whether the end of the stream was reached.
+        """
+        first = self.inbox.get(timeout=0.1)
+        if first is None:
+            return [], False
+        if first is STOP:
+            return [], True
+        if not first.infer:
+            return [first], False
+        batch = [first]
+        size = 1
+        deadline = first.capturedAt + self.maxDelay
+        while size < self.maxBatchSize:
+            remaining = deadline - time.perf_counter()
+            # once the deadline has passed, still take whatever is already waiting
+            frame = self.inbox.get(timeout=max(0, remaining))
+            if frame is None:
+                break
+            if frame is STOP:
+                return batch, True
+            batch.append(frame)
+            size += frame.infer
+        return batch, False
+
+    def _infer(self, batch):
+        inferred = [frame for frame in batch if frame.infer]
+        if inferred:
+            startTime = time.perf_counter()
+            try:
+                results = self.model([frame.img for frame in inferred], verbose=False)
+            except Exception as e:
+                # e.g. CUDA out of memory or a corrupt frame, lose this batch but keep the stream going
+                self.stats.record_failure()
+                print(f"[{self.name}] batch of {len(inferred)} dropped: {e}")
+                return
+            endTime = time.perf_counter()
+            for frame, r in zip(inferred, results):
+                frame.result = r
+            self.stats.record(len(inferred), endTime - startTime, startTime - inferred[0].capturedAt,
+                              [endTime - frame.capturedAt for frame in inferred])
+        for frame in batch:
+            self.outbox.put(frame)
+
+    def _run(self):
+        try:
+            while self.running:
+                batch, stopped = self._collect()
+                if batch:
+                    self._infer(batch)
+                if stopped:
+                    self.running = False
+        finally:
+            # the later stages only finish once STOP reaches them
+            self.running = False
+            self.outbox.put(STOP)
+
+    def summary(self):
+        summary = self.stats.summary()
+        summary["queue"] = self.inbox.summary()
+        return summary
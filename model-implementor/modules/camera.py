@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+import cv2
+from modules.motion import MotionGate
+from modules.pipeline import BLOCK, StageMetrics
+from modules.sort import Sort
+
+
+def load_config(path):
+    """
+    Reads the ingest service config: the shared model weights and the list of cameras.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    if not config.get("cameras"):
+        raise ValueError(f"No cameras configured in {path}")
+    return config
+
+
+class Frame(object):
+    """
+    A decoded frame on its way through the pipeline.
+    """
+    __slots__ = ("camera", "img", "index", "infer", "capturedAt", "result", "detections", "tracks")
+
+    def __init__(self, camera, img, index, infer=True):
+        self.camera = camera
+        self.img = img
+        self.index = index
+        # frames the motion gate passes over skip the model and only advance the tracker
+        self.infer = infer
+        self.capturedAt = time.perf_counter()
+        self.result = None
+        self.detections = None
+        self.tracks = None
+
+
+class Camera(object):
+    """
+    One CCTV feed: a decode worker thread plus the feed's own tracker and alert state.
+    """
+
+    def __init__(self, name, source, location=None, maxAge=20, minHits=3, iouThreshold=0.3, reconnectDelay=2.0, motion=None):
+        self.name = name
+        # numeric sources are local capture devices, everything else is a file or stream url
+        self.source = int(source) if str(source).isdigit() else source
+        self.isFile = isinstance(self.source, str) and "://" not in self.source
+        self.location = location
+        self.getLoc = None
+
+        self.tracker = Sort(max_age=maxAge, min_hits=minHits, iou_threshold=iouThreshold)
+        self.totalAccidents = set()
+        self.tempConf = 0
+        self.gate = MotionGate(**motion) if motion is not None else None
+
+        self.frames = None
+        self.reconnectDelay = reconnectDelay
+        self.framesRead = 0
+        self.metrics = StageMetrics()
+        self.running = False
+        self._thread = None
+
+    def locate(self, geolocator):
+        if self.location:
+            self.getLoc = geolocator.reverse(self.location)
+        return self.getLoc
+
+    def start(self, frames):
+        """
+        Starts decoding into `frames`, a BoundedQueue shared with the other cameras.
+        """
+        self.frames = frames
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _put(self, img):
+        frame = Frame(self, img, self.framesRead, infer=self.gate is None or self.gate.should_infer(img))
+        # files can be read faster than we infer, so they always wait instead of skipping footage
+        self.frames.put(frame, policy=BLOCK if self.isFile else None)
+
+    def _run(self):
+        cap = cv2.VideoCapture(self.source)
+        while self.running:
+            startTime = time.perf_counter()
+            success, img = cap.read()
+            if not success:
+                if self.isFile:
+                    print(f"[{self.name}] end of {self.source}")
+                    break
+                print(f"[{self.name}] lost stream, reconnecting in {self.reconnectDelay}s")
+                cap.release()
+                time.sleep(self.reconnectDelay)
+                cap = cv2.VideoCapture(self.source)
+                continue
+            self.framesRead += 1
+            self.metrics.record(time.perf_counter() - startTime)
+            self._put(img)
+        cap.release()
+        self.running = False
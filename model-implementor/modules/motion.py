@@ -0,0 +1,66 @@
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate(object):
+    """
+    Decides which of a camera's frames are worth running through the model.
+
+    Each frame is shrunk to a small grayscale thumbnail and differenced against the
+    previous one. While the scene is changing (more than `threshold` of the pixels moved
+    by over `pixelDelta` levels) every frame is inferred, and that keeps going for
+    `cooldown` frames after the motion stops. In a steady scene only one frame in every
+    `skipFrames + 1` is inferred, so a crash that has already come to rest is still seen.
+    """
+
+    def __init__(self, threshold=0.01, pixelDelta=25, skipFrames=4, cooldown=15, width=160):
+        self.threshold = threshold
+        self.pixelDelta = pixelDelta
+        self.skipFrames = skipFrames
+        self.cooldown = cooldown
+        self.width = width
+        self.frames = 0
+        self.inferred = 0
+        self.startTime = None
+        self._previous = None
+        self._active = 0
+        self._sinceInfer = 0
+
+    def _thumbnail(self, img):
+        h, w = img.shape[:2]
+        small = cv2.resize(img, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+    def changed(self, img):
+        thumbnail = self._thumbnail(img)
+        previous, self._previous = self._previous, thumbnail
+        if previous is None:
+            return True
+        moved = np.count_nonzero(cv2.absdiff(thumbnail, previous) > self.pixelDelta)
+        return moved >= self.threshold * thumbnail.size
+
+    def should_infer(self, img):
+        if self.startTime is None:
+            self.startTime = time.time()
+        self.frames += 1
+        if self.changed(img):
+            self._active = self.cooldown
+        elif self._active > 0:
+            self._active -= 1
+        infer = self._active > 0 or self._sinceInfer >= self.skipFrames
+        self._sinceInfer = 0 if infer else self._sinceInfer + 1
+        if infer:
+            self.inferred += 1
+        return infer
+
+    def summary(self):
+        elapsed = max(time.time() - self.startTime, 1e-6) if self.startTime else 0.0
+        return {
+            "frames": self.frames,
+            "inferred": self.inferred,
+            "skipped": self.frames - self.inferred,
+            "savedPercent": 100.0 * (self.frames - self.inferred) / self.frames if self.frames else 0.0,
+            "framesPerSecond": self.frames / elapsed if elapsed else 0.0,
+            "inferencesPerSecond": self.inferred / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,177 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+POLICIES = (DROP_OLDEST, BLOCK)
+
+# Marks the end of the stream; every stage forwards it downstream and exits.
+STOP = object()
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+class BoundedQueue(object):
+    """
+    A bounded FIFO between two stages.
+
+    When full, `drop_oldest` discards the oldest queued item so the producer never
+    waits, while `block` makes the producer wait for room (backpressure).
+    """
+
+    def __init__(self, name, maxsize=16, policy=BLOCK):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}, expected one of {POLICIES}")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.maxDepth = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, item, policy=None):
+        if item is STOP or (policy or self.policy) == BLOCK:
+            self._queue.put(item)
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        if self._queue.get_nowait() is STOP:
+                            # never throw away the end of the stream
+                            self._queue.put_nowait(STOP)
+                            return
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+        self.maxDepth = max(self.maxDepth, self._queue.qsize())
+
+    def get(self, timeout=None):
+        """
+        Returns the next item, or None if nothing arrived within `timeout`.
+        """
+        try:
+            if timeout == 0:
+                return self._queue.get_nowait()
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def empty(self):
+        return self._queue.empty()
+
+    def summary(self):
+        return {"depth": self.depth(), "maxDepth": self.maxDepth, "maxsize": self.maxsize, "policy": self.policy, "dropped": self.dropped}
+
+
+class StageMetrics(object):
+    """
+    Items handled by a stage and how long the handler took, over the last `window` items.
+    """
+
+    def __init__(self, window=1000):
+        self.processed = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self.processed += 1
+            self.latencies.append(latency)
+
+    def summary(self):
+        with self._lock:
+            latencies = list(self.latencies)
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "latencyMsP50": percentile(latencies, 50) * 1000,
+            "latencyMsP99": percentile(latencies, 99) * 1000,
+        }
+
+
+class Stage(object):
+    """
+    Pulls items off `inbox`, runs `handler` on each and forwards whatever it returns
+    to `outbox`. A stage runs either on its own thread (`start`) or as a coroutine on
+    the event loop (`run_async`) for handlers that need to schedule asyncio tasks.
+    """
+
+    def __init__(self, name, inbox, handler, outbox=None, onStop=None):
+        self.name = name
+        self.inbox = inbox
+        self.handler = handler
+        self.outbox = outbox
+        self.onStop = onStop
+        self.metrics = StageMetrics()
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name=f"stage-{self.name}", daemon=True)
+        self._thread.start()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def process(self, item):
+        """
+        Handles one item. Returns False once the end of the stream has been reached.
+        """
+        if item is STOP:
+            self.running = False
+            if self.onStop is not None:
+                self.onStop()
+            if self.outbox is not None:
+                self.outbox.put(STOP)
+            return False
+        startTime = time.perf_counter()
+        try:
+            result = self.handler(item)
+        except Exception as e:
+            self.metrics.errors += 1
+            print(f"[{self.name}] stage error: {e}")
+            return True
+        self.metrics.record(time.perf_counter() - startTime)
+        if result is not None and self.outbox is not None:
+            self.outbox.put(result)
+        return True
+
+    def _run(self):
+        while self.running:
+            item = self.inbox.get(timeout=0.1)
+            if item is not None and not self.process(item):
+                break
+
+    async def run_async(self, idleSleep=0.005):
+        self.running = True
+        while self.running:
+            item = self.inbox.get(timeout=0)
+            if item is None:
+                await asyncio.sleep(idleSleep)
+                continue
+            if not self.process(item):
+                break
+            # give the tasks scheduled by the handler a turn
+            await asyncio.sleep(0)
+
+    def summary(self):
+        summary = self.metrics.summary()
+        summary["queue"] = self.inbox.summary()
+        return summary
@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import cvzone
+
+
+def draw_annotations(img, detections, tracks):
+    """
+    Draws the raw detections and the tracked boxes with their ids onto `img`.
+    """
+    for x1, y1, x2, y2, conf in detections:
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        cvzone.cornerRect(img, (x1, y1, x2 - x1, y2 - y1))
+        cvzone.putTextRect(img, f'Accident {conf}', (max(0, x1), max(35, y1)), colorR=(0, 165, 255))
+    for x1, y1, x2, y2, id in tracks:
+        x1, y1, x2, y2, id = int(x1), int(y1), int(x2), int(y2), int(id)
+        w, h = x2 - x1, y2 - y1
+        cvzone.cornerRect(img, (x1, y1, w, h), colorR=(255, 0, 255))
+        cvzone.putTextRect(img, f'{id}', (max(0, x1), max(35, y1)))
+        cx, cy = x1 + w // 2, y1 + h // 2
+        cv2.circle(img, (cx, cy), 5, (255, 0, 255), cv2.FILLED)
+    return img
+
+
+class RateLimiter(object):
+    """
+    Lets through at most `fps` frames per second for each camera.
+    """
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+        self._last = {}
+
+    def ready(self, key):
+        return time.perf_counter() - self._last.get(key, float("-inf")) >= self.interval
+
+    def mark(self, key):
+        self._last[key] = time.perf_counter()
+
+
+class MjpegServer(object):
+    """
+    Serves each camera's annotated frames as an MJPEG stream at /<camera name>.mjpg.
+    Frames are only encoded while somebody is connected, and at most `fps` per second.
+    """
+
+    def __init__(self, host="0.0.0.0", port=8090, fps=5, quality=70):
+        self.limiter = RateLimiter(fps)
+        self.quality = quality
+        self.viewers = 0
+        self._frames = {}
+        self._condition = threading.Condition()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def _handler(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                name = self.path.strip("/").rsplit(".mjpg", 1)[0]
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+                with sink._condition:
+                    sink.viewers += 1
+                try:
+                    sink._stream(name, self.wfile)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with sink._condition:
+                        sink.viewers -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _stream(self, name, wfile):
+        last = None
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._frames.get(name) is not last, timeout=5)
+                jpeg = self._frames.get(name)
+            if jpeg is None or jpeg is last:
+                continue
+            last = jpeg
+            wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % len(jpeg))
+            wfile.write(jpeg)
+            wfile.write(b"\r\n")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mjpeg-server", daemon=True)
+        self._thread.start()
+        print(f"Annotated streams on http://{self._server.server_address[0]}:{self._server.server_address[1]}/<camera>.mjpg")
+
+    def wants(self, frame):
+        return self.viewers > 0 and self.limiter.ready(frame.camera.name)
+
+    def write(self, frame, img):
+        self.limiter.mark(frame.camera.name)
+        _, jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        with self._condition:
+            self._frames[frame.camera.name] = jpeg.tobytes()
+            self._condition.notify_all()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class SegmentWriter(object):
+    """
+    Records each camera's annotated frames at `fps` into MP4 files of `segmentSeconds` each.
+    """
+
+    def __init__(self, directory="./recordings", fps=5, segmentSeconds=300):
+        self.directory = directory
+        self.fps = fps
+        self.segmentSeconds = segmentSeconds
+        self.limiter = RateLimiter(fps)
+        self._writers = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        pass
+
+    def wants(self, frame):
+        return self.limiter.ready(frame.camera.name)
+
+    def _writer(self, name, img):
+        writer, openedAt = self._writers.get(name, (None, 0))
+        if writer is not None and time.time() - openedAt < self.segmentSeconds:
+            return writer
+        if writer is not None:
+            writer.release()
+        h, w = img.shape[:2]
+        path = os.path.join(self.directory, "%s-%s.mp4" % (name, time.strftime("%Y%m%d-%H%M%S")))
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (w, h))
+        self._writers[name] = (writer, time.time())
+        return writer
+
+    def write(self, frame, img):
+        self.limiter.mark(frame.camera.name)
+        self._writer(frame.camera.name, img).write(img)
+
+    def close(self):
+        for writer, _ in self._writers.values():
+            writer.release()
+        self._writers = {}
+
+
+def build_sink(options):
+    """
+    Builds the annotated output sink described by the `output` config block, if any.
+    """
+    if not options:
+        return None
+    options = dict(options)
+    kind = options.pop("type")
+    if kind == "mjpeg":
+        return MjpegServer(**options)
+    if kind == "mp4":
+        return SegmentWriter(**options)
+    raise ValueError(f"Unknown output type {kind!r}, expected 'mjpeg' or 'mp4'")
+
+
+class Renderer(object):
+    """
+    Render stage handler. Drawing only happens for frames that a local window or the
+    output sink is actually going to use; otherwise the frame is dropped untouched.
+    """
+
+    def __init__(self, cameras, display=True, sink=None):
+        self.cameras = cameras
+        self.display = display
+        self.sink = sink
+        self.drawn = 0
+        self.skipped = 0
+
+    @property
+    def enabled(self):
+        return self.display or self.sink is not None
+
+    def __call__(self, frame):
+        toSink = self.sink is not None and self.sink.wants(frame)
+        if not (self.display or toSink):
+            self.skipped += 1
+            return
+        self.drawn += 1
+        img = draw_annotations(frame.img.copy(), frame.detections, frame.tracks)
+        if toSink:
+            self.sink.write(frame, img)
+        if self.display:
+            # Displaying the video
+            cv2.imshow(frame.camera.name, img)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                for camera in self.cameras:
+                    camera.stop()
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+        if self.display:
+            cv2.destroyAllWindows()
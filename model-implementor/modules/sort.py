@@ -19,18 +19,11 @@ from __future__ import print_function
 
 import os
 import numpy as np
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
 
 import glob
 import time
 import argparse
-from filterpy.kalman import KalmanFilter
-
-np.random.seed(0)
+from concurrent.futures import ProcessPoolExecutor
 
 
 def linear_assignment(cost_matrix):
@@ -50,7 +43,13 @@ def iou_batch(bb_test, bb_gt):
   """
   bb_gt = np.expand_dims(bb_gt, 0)
   bb_test = np.expand_dims(bb_test, 1)
-  
+  return iou_pairs(bb_test, bb_gt)
+
+
+def iou_pairs(bb_test, bb_gt):
+  """
+  Computes IOU between bb_test[i] and bb_gt[i] (or whatever the two arrays broadcast to)
+  """
   xx1 = np.maximum(bb_test[..., 0], bb_gt[..., 0])
   yy1 = np.maximum(bb_test[..., 1], bb_gt[..., 1])
   xx2 = np.minimum(bb_test[..., 2], bb_gt[..., 2])
@@ -58,9 +57,94 @@ def iou_batch(bb_test, bb_gt):
   w = np.maximum(0., xx2 - xx1)
   h = np.maximum(0., yy2 - yy1)
   wh = w * h
-  o = wh / ((bb_test[..., 2] - bb_test[..., 0]) * (bb_test[..., 3] - bb_test[..., 1])                                      
-    + (bb_gt[..., 2] - bb_gt[..., 0]) * (bb_gt[..., 3] - bb_gt[..., 1]) - wh)                                              
-  return(o)  
+  o = wh / ((bb_test[..., 2] - bb_test[..., 0]) * (bb_test[..., 3] - bb_test[..., 1])
+    + (bb_gt[..., 2] - bb_gt[..., 0]) * (bb_gt[..., 3] - bb_gt[..., 1]) - wh)
+  return(o)
+
+
+def candidate_pairs(bb_test, bb_gt):
+  """
+  Sort-and-sweep over the x-extents: returns the index arrays (test, gt) of every pair of
+    boxes that overlap, without building the full len(bb_test) x len(bb_gt) matrix
+  """
+  order = np.argsort(bb_gt[:, 0], kind='stable')
+  x1_sorted = bb_gt[order, 0]
+  # a gt box can only reach past the test box's x1 if it starts at most max_w before it
+  max_w = np.max(bb_gt[:, 2] - bb_gt[:, 0])
+  lo = np.searchsorted(x1_sorted, bb_test[:, 0] - max_w, side='left')
+  hi = np.searchsorted(x1_sorted, bb_test[:, 2], side='left')
+  counts = np.maximum(hi - lo, 0)
+  test_idx = np.repeat(np.arange(len(bb_test)), counts)
+  offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+  gt_idx = order[np.repeat(lo, counts) + offsets]
+  t, g = bb_test[test_idx], bb_gt[gt_idx]
+  overlap = (np.minimum(t[:, 2], g[:, 2]) > np.maximum(t[:, 0], g[:, 0])) & (np.minimum(t[:, 3], g[:, 3]) > np.maximum(t[:, 1], g[:, 1]))
+  return test_idx[overlap], gt_idx[overlap]
+
+
+def connected_components(n, u, v):
+  """
+  Labels the n nodes of the graph with edges (u[i], v[i]) by the smallest node of their component
+  """
+  labels = np.arange(n)
+  while True:
+    m = np.minimum(labels[u], labels[v])
+    new = labels.copy()
+    np.minimum.at(new, u, m)
+    np.minimum.at(new, v, m)
+    new = new[new]
+    if np.array_equal(new, labels):
+      return labels
+    labels = new
+
+
+def gated_assignment(detections, trackers, iou_threshold):
+  """
+  Same assignment as linear_assignment(-iou_batch(detections, trackers)), but IOU is only
+    computed for boxes that overlap and the assignment is solved separately for each group
+    of boxes connected by an overlap.
+
+  Returns the matched (detection, tracker) index pairs sorted by detection, and their IOUs,
+    or None when a group has exactly tied IOUs (duplicate or integer boxes): which of the
+    tied pairs the solver picks depends on the whole matrix, so those frames must be solved densely
+  """
+  d_idx, t_idx = candidate_pairs(detections, trackers)
+  iou = iou_pairs(detections[d_idx], trackers[t_idx])
+  above = iou > iou_threshold
+  if not above.any():
+    return np.empty((0,2),dtype=int), np.empty(0)
+  if np.bincount(d_idx[above]).max() == 1 and np.bincount(t_idx[above]).max() == 1:
+    order = np.argsort(d_idx[above], kind='stable')
+    return np.stack((d_idx[above][order], t_idx[above][order]), axis=1), iou[above][order]
+
+  n_det = len(detections)
+  node_labels = connected_components(n_det + len(trackers), d_idx, t_idx + n_det)
+  labels = node_labels[d_idx]
+  order = np.lexsort((iou, labels))
+  if np.any((np.diff(labels[order]) == 0) & (np.diff(iou[order]) == 0)):
+    return None
+  d_nodes, t_nodes = np.unique(d_idx), np.unique(t_idx)
+  n_dets = np.bincount(node_labels[d_nodes], minlength=len(node_labels))
+  n_trks = np.bincount(node_labels[t_nodes + n_det], minlength=len(node_labels))
+
+  # a group with a single detection or a single tracker simply takes its best overlap
+  simple = (n_dets[labels] == 1) | (n_trks[labels] == 1)
+  order = np.flatnonzero(simple)[np.lexsort((-iou[simple], labels[simple]))]
+  best = order[np.r_[True, np.diff(labels[order]) != 0]] if len(order) else order
+  pairs, ious = [np.stack((d_idx[best], t_idx[best]), axis=1)], [iou[best]]
+
+  order = np.flatnonzero(~simple)[np.argsort(labels[~simple], kind='stable')]
+  for g in np.split(order, np.flatnonzero(np.diff(labels[order])) + 1) if len(order) else []:
+    dets, d_local = np.unique(d_idx[g], return_inverse=True)
+    trks, t_local = np.unique(t_idx[g], return_inverse=True)
+    local = np.zeros((len(dets), len(trks)))
+    local[d_local, t_local] = iou[g]
+    m = linear_assignment(-local).reshape(-1, 2)
+    pairs.append(np.stack((dets[m[:, 0]], trks[m[:, 1]]), axis=1))
+    ious.append(local[m[:, 0], m[:, 1]])
+  pairs, ious = np.concatenate(pairs).astype(int), np.concatenate(ious)
+  order = np.argsort(pairs[:, 0], kind='stable')
+  return pairs[order], ious[order]
 
 
 def convert_bbox_to_z(bbox):
@@ -78,6 +162,16 @@ def convert_bbox_to_z(bbox):
   return np.array([x, y, s, r]).reshape((4, 1))
 
 
+def boxes_to_z(bboxes):
+  """
+  Batched convert_bbox_to_z: takes an (N,4+) array of [x1,y1,x2,y2,...] rows and
+    returns the (N,4) array of [x,y,s,r] rows
+  """
+  w = bboxes[:, 2] - bboxes[:, 0]
+  h = bboxes[:, 3] - bboxes[:, 1]
+  return np.stack((bboxes[:, 0] + w/2., bboxes[:, 1] + h/2., w * h, w / h.astype(float)), axis=1)
+
+
 def convert_x_to_bbox(x,score=None):
   """
   Takes a bounding box in the centre form [x,y,s,r] and returns it in the form
@@ -91,75 +185,162 @@ def convert_x_to_bbox(x,score=None):
     return np.array([x[0]-w/2.,x[1]-h/2.,x[0]+w/2.,x[1]+h/2.,score]).reshape((1,5))
 
 
-class KalmanBoxTracker(object):
+def x_to_boxes(x):
+  """
+  Batched convert_x_to_bbox: takes an (N,4+) array of [x,y,s,r,...] states and
+    returns the (N,4) array of [x1,y1,x2,y2] rows
+  """
+  w = np.sqrt(x[:, 2] * x[:, 3])
+  h = x[:, 2] / w
+  return np.stack((x[:, 0]-w/2., x[:, 1]-h/2., x[:, 0]+w/2., x[:, 1]+h/2.), axis=1)
+
+
+class BatchedKalmanBoxTracker(object):
   """
-  This class represents the internal state of individual tracked objects observed as bbox.
+  This class represents the internal state of all tracked objects of one Sort instance.
+  States and covariances are stacked into arrays so that every predict/update step is a
+  few vectorised operations over all tracks instead of one Kalman filter per object.
   """
   count = 0
-  def __init__(self,bbox):
+  #define constant velocity model
+  F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]], dtype=float)
+  H = np.array([[1,0,0,0,0,0,0],[0,1,0,0,0,0,0],[0,0,1,0,0,0,0],[0,0,0,1,0,0,0]], dtype=float)
+  R = np.diag([1., 1., 10., 10.])
+  Q = np.diag([1., 1., 1., 1., .01, .01, .0001])
+  P0 = np.diag([10., 10., 10., 10., 1e4, 1e4, 1e4]) #give high uncertainty to the unobservable initial velocities
+  I = np.eye(7)
+
+  def __init__(self):
+    self.x = np.empty((0, 7))
+    self.P = np.empty((0, 7, 7))
+    self.id = np.empty(0, dtype=np.int64)
+    self.time_since_update = np.empty(0, dtype=np.int64)
+    self.hits = np.empty(0, dtype=np.int64)
+    self.hit_streak = np.empty(0, dtype=np.int64)
+    self.age = np.empty(0, dtype=np.int64)
+
+  def __len__(self):
+    return len(self.id)
+
+  def add(self, bboxes):
     """
-    Initialises a tracker using initial bounding box.
+    Initialises a track for every row of bboxes, in row order.
     """
-    #define constant velocity model
-    self.kf = KalmanFilter(dim_x=7, dim_z=4) 
-    self.kf.F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]])
-    self.kf.H = np.array([[1,0,0,0,0,0,0],[0,1,0,0,0,0,0],[0,0,1,0,0,0,0],[0,0,0,1,0,0,0]])
-
-    self.kf.R[2:,2:] *= 10.
-    self.kf.P[4:,4:] *= 1000. #give high uncertainty to the unobservable initial velocities
-    self.kf.P *= 10.
-    self.kf.Q[-1,-1] *= 0.01
-    self.kf.Q[4:,4:] *= 0.01
-
-    self.kf.x[:4] = convert_bbox_to_z(bbox)
-    self.time_since_update = 0
-    self.id = KalmanBoxTracker.count
-    KalmanBoxTracker.count += 1
-    self.history = []
-    self.hits = 0
-    self.hit_streak = 0
-    self.age = 0
-
-  def update(self,bbox):
+    n = len(bboxes)
+    if n == 0:
+      return
+    x = np.zeros((n, 7))
+    x[:, :4] = boxes_to_z(bboxes)
+    zeros = np.zeros(n, dtype=np.int64)
+    self.x = np.concatenate((self.x, x))
+    self.P = np.concatenate((self.P, np.broadcast_to(self.P0, (n, 7, 7))))
+    self.id = np.concatenate((self.id, np.arange(BatchedKalmanBoxTracker.count, BatchedKalmanBoxTracker.count + n)))
+    BatchedKalmanBoxTracker.count += n
+    self.time_since_update = np.concatenate((self.time_since_update, zeros))
+    self.hits = np.concatenate((self.hits, zeros))
+    self.hit_streak = np.concatenate((self.hit_streak, zeros))
+    self.age = np.concatenate((self.age, zeros))
+
+  def keep(self, mask):
     """
-    Updates the state vector with observed bbox.
+    Drops every track whose entry in the boolean mask is False.
     """
-    self.time_since_update = 0
-    self.history = []
-    self.hits += 1
-    self.hit_streak += 1
-    self.kf.update(convert_bbox_to_z(bbox))
+    self.x = self.x[mask]
+    self.P = self.P[mask]
+    self.id = self.id[mask]
+    self.time_since_update = self.time_since_update[mask]
+    self.hits = self.hits[mask]
+    self.hit_streak = self.hit_streak[mask]
+    self.age = self.age[mask]
+
+  def _advance(self):
+    self.x[(self.x[:, 6] + self.x[:, 2]) <= 0, 6] = 0.
+    self.x = self.x @ self.F.T
+    self.P = self.F @ self.P @ self.F.T + self.Q
 
   def predict(self):
     """
-    Advances the state vector and returns the predicted bounding box estimate.
+    Advances the state vectors and returns the predicted bounding box estimates.
     """
-    if((self.kf.x[6]+self.kf.x[2])<=0):
-      self.kf.x[6] *= 0.0
-    self.kf.predict()
+    self._advance()
     self.age += 1
-    if(self.time_since_update>0):
-      self.hit_streak = 0
+    self.hit_streak[self.time_since_update > 0] = 0
     self.time_since_update += 1
-    self.history.append(convert_x_to_bbox(self.kf.x))
-    return self.history[-1]
+    return x_to_boxes(self.x)
+
+  def coast(self):
+    """
+    Advances the state vectors for a frame that was never sent to the detector.
+    Unlike predict() this is not counted as a missed detection.
+    """
+    self._advance()
+    return x_to_boxes(self.x)
+
+  def update(self, idx, bboxes):
+    """
+    Updates the state vectors of the tracks at positions idx with the observed bboxes.
+    """
+    if len(idx) == 0:
+      return
+    self.time_since_update[idx] = 0
+    self.hits[idx] += 1
+    self.hit_streak[idx] += 1
+
+    x = self.x[idx][:, :, None]
+    P = self.P[idx]
+    y = boxes_to_z(bboxes)[:, :, None] - self.H @ x
+    PHT = P @ self.H.T
+    S = self.H @ PHT + self.R
+    K = PHT @ np.linalg.inv(S)
+    I_KH = self.I - K @ self.H
+    self.x[idx] = (x + K @ y)[:, :, 0]
+    self.P[idx] = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
 
   def get_state(self):
     """
-    Returns the current bounding box estimate.
+    Returns the current bounding box estimates.
     """
-    return convert_x_to_bbox(self.kf.x)
+    return x_to_boxes(self.x)
 
 
-def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
+def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3,gated = False):
   """
   Assigns detections to tracked object (both represented as bounding boxes)
 
+  With gated=True only overlapping boxes are compared (see gated_assignment), which
+    gives the same matches and unmatched detections, in the same order, without the
+    quadratic IOU matrix on busy scenes. Unmatched trackers are the same set, in index order.
+    Frames with exactly tied IOUs are still solved densely.
+
   Returns 3 lists of matches, unmatched_detections and unmatched_trackers
   """
   if(len(trackers)==0):
     return np.empty((0,2),dtype=int), np.arange(len(detections)), np.empty((0,5),dtype=int)
 
+  assigned = gated_assignment(detections, trackers, iou_threshold) if gated and len(detections) > 0 else None
+  if(assigned is not None):
+    matched_indices, matched_iou = assigned
+    overlapping = matched_indices[matched_iou > 0]
+    # The dense solver below pairs min(detections, trackers) boxes, leftovers that do not
+    #   overlap at all included, and lists the never paired detections before the ones
+    #   paired with a low IOU. With no more detections than trackers every detection is
+    #   paired. With more, which ones stay unpaired depends on how the solver breaks ties,
+    #   so those frames are solved densely unless every tracker has an overlapping pair.
+    if len(detections) <= len(trackers) or len(overlapping) == len(trackers):
+      matches = matched_indices[matched_iou >= iou_threshold]
+      det_matched = np.zeros(len(detections), dtype=bool)
+      det_matched[matches[:,0]] = True
+      trk_matched = np.zeros(len(trackers), dtype=bool)
+      trk_matched[matches[:,1]] = True
+      if len(detections) <= len(trackers):
+        unmatched_detections = np.flatnonzero(~det_matched)
+      else:
+        det_paired = np.zeros(len(detections), dtype=bool)
+        det_paired[overlapping[:,0]] = True
+        low_iou = overlapping[~det_matched[overlapping[:,0]],0]
+        unmatched_detections = np.concatenate((np.flatnonzero(~det_paired), low_iou))
+      return matches, unmatched_detections, np.flatnonzero(~trk_matched)
+
   iou_matrix = iou_batch(detections, trackers)
 
   if min(iou_matrix.shape) > 0:
@@ -170,43 +351,55 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
       matched_indices = linear_assignment(-iou_matrix)
   else:
     matched_indices = np.empty(shape=(0,2))
+  matched_indices = matched_indices.astype(int).reshape(-1, 2)
 
-  unmatched_detections = []
-  for d, det in enumerate(detections):
-    if(d not in matched_indices[:,0]):
-      unmatched_detections.append(d)
-  unmatched_trackers = []
-  for t, trk in enumerate(trackers):
-    if(t not in matched_indices[:,1]):
-      unmatched_trackers.append(t)
+  det_assigned = np.zeros(len(detections), dtype=bool)
+  det_assigned[matched_indices[:,0]] = True
+  trk_assigned = np.zeros(len(trackers), dtype=bool)
+  trk_assigned[matched_indices[:,1]] = True
 
   #filter out matched with low IOU
-  matches = []
-  for m in matched_indices:
-    if(iou_matrix[m[0], m[1]]<iou_threshold):
-      unmatched_detections.append(m[0])
-      unmatched_trackers.append(m[1])
-    else:
-      matches.append(m.reshape(1,2))
-  if(len(matches)==0):
-    matches = np.empty((0,2),dtype=int)
-  else:
-    matches = np.concatenate(matches,axis=0)
+  low_iou = iou_matrix[matched_indices[:,0], matched_indices[:,1]] < iou_threshold
+  unmatched_detections = np.concatenate((np.flatnonzero(~det_assigned), matched_indices[low_iou,0]))
+  unmatched_trackers = np.concatenate((np.flatnonzero(~trk_assigned), matched_indices[low_iou,1]))
+  matches = matched_indices[~low_iou]
+
+  return matches, unmatched_detections, unmatched_trackers
+
 
-  return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+# Below this many detection x tracker pairs the dense IOU matrix is as fast or faster than
+# gating, which only wins clearly from about 45k pairs, see benchmarks/association_bench.py
+GATED_MIN_PAIRS = 50000
 
 
 class Sort(object):
-  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, association='auto'):
     """
     Sets key parameters for SORT
+
+    association is 'dense', 'gated' or 'auto' (gated once a frame has GATED_MIN_PAIRS pairs)
     """
+    if association not in ('dense', 'gated', 'auto'):
+      raise ValueError("association must be 'dense', 'gated' or 'auto', got %r" % (association,))
     self.max_age = max_age
     self.min_hits = min_hits
     self.iou_threshold = iou_threshold
-    self.trackers = []
+    self.association = association
+    self.trackers = BatchedKalmanBoxTracker()
     self.frame_count = 0
 
+  def _confirmed(self, boxes):
+    """
+    Returns [x1,y1,x2,y2,id] rows for the confirmed tracks, newest track first.
+    """
+    trackers = self.trackers
+    mask = (trackers.time_since_update < 1) & ((trackers.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+    mask &= ~np.any(np.isnan(boxes), axis=1)
+    idx = np.flatnonzero(mask)[::-1]
+    if(len(idx)==0):
+      return np.empty((0,5))
+    return np.hstack((boxes[idx], trackers.id[idx, None] + 1.)) # +1 as MOT benchmark requires positive
+
   def update(self, dets=np.empty((0, 5))):
     """
     Params:
@@ -218,39 +411,83 @@ class Sort(object):
     """
     self.frame_count += 1
     # get predicted locations from existing trackers.
-    trks = np.zeros((len(self.trackers), 5))
-    to_del = []
-    ret = []
-    for t, trk in enumerate(trks):
-      pos = self.trackers[t].predict()[0]
-      trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
-      if np.any(np.isnan(pos)):
-        to_del.append(t)
-    trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
-    for t in reversed(to_del):
-      self.trackers.pop(t)
-    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold)
+    trks = self.trackers.predict()
+    valid = ~np.any(np.isnan(trks), axis=1)
+    if not valid.all():
+      self.trackers.keep(valid)
+      trks = trks[valid]
+    gated = self.association == 'gated' or (self.association == 'auto' and len(dets) * len(trks) >= GATED_MIN_PAIRS)
+    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold, gated)
 
     # update matched trackers with assigned detections
-    for m in matched:
-      self.trackers[m[1]].update(dets[m[0], :])
+    self.trackers.update(matched[:,1], dets[matched[:,0], :])
 
     # create and initialise new trackers for unmatched detections
-    for i in unmatched_dets:
-        trk = KalmanBoxTracker(dets[i,:])
-        self.trackers.append(trk)
-    i = len(self.trackers)
-    for trk in reversed(self.trackers):
-        d = trk.get_state()[0]
-        if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
-          ret.append(np.concatenate((d,[trk.id+1])).reshape(1,-1)) # +1 as MOT benchmark requires positive
-        i -= 1
-        # remove dead tracklet
-        if(trk.time_since_update > self.max_age):
-          self.trackers.pop(i)
-    if(len(ret)>0):
-      return np.concatenate(ret)
-    return np.empty((0,5))
+    self.trackers.add(dets[unmatched_dets.astype(int), :])
+    ret = self._confirmed(self.trackers.get_state())
+    # remove dead tracklet
+    self.trackers.keep(self.trackers.time_since_update <= self.max_age)
+    return ret
+
+  def predict(self):
+    """
+    Advances every track by one frame without running association, for frames that were
+    skipped instead of sent to the detector. Tracks are kept alive and keep their hit
+    streaks, so the next update() carries on as if the frame had been observed.
+    Returns the predicted boxes of the confirmed tracks in the same format as update().
+    """
+    return self._confirmed(self.trackers.coast())
+
+MOT_ROW = '%d,%d,%.2f,%.2f,%.2f,%.2f,1,-1,-1,-1'
+
+
+def split_frames(seq_dets):
+  """
+  Groups the rows of a MOT det.txt array by frame in one pass.
+  Returns a list with the [x1,y1,x2,y2,score] detections of frames 1..max, empty frames included.
+  """
+  seq_dets = seq_dets[np.argsort(seq_dets[:, 0], kind='stable')]
+  dets = seq_dets[:, 2:7].copy()
+  dets[:, 2:4] += dets[:, 0:2] #convert to [x1,y1,w,h] to [x1,y1,x2,y2]
+  frames = np.arange(1, int(seq_dets[:, 0].max()) + 1) if len(seq_dets) else np.empty(0)
+  bounds = np.searchsorted(seq_dets[:, 0], np.append(frames, frames[-1] + 1 if len(frames) else 1))
+  return [dets[bounds[i]:bounds[i + 1]] for i in range(len(frames))]
+
+
+def track_sequence(seq_dets_fn, seq, output_dir, max_age, min_hits, iou_threshold, viewer=None):
+  """
+  Runs a fresh tracker over one det.txt sequence and writes output_dir/<seq>.txt in a single write.
+  Track ids restart at 1 for every sequence, so results do not depend on the order in which
+  sequences are processed or on how they are spread over workers.
+  Returns (seq, tracking seconds, frames).
+  """
+  BatchedKalmanBoxTracker.count = 0
+  mot_tracker = Sort(max_age=max_age,
+                     min_hits=min_hits,
+                     iou_threshold=iou_threshold) #create instance of the SORT tracker
+  frames = split_frames(np.loadtxt(seq_dets_fn, delimiter=',', ndmin=2))
+  total_time = 0.0
+  rows = []
+  for frame, dets in enumerate(frames, 1): #detection and frame numbers begin at 1
+    if(viewer):
+      viewer.show_frame(seq, frame)
+
+    start_time = time.time()
+    trackers = mot_tracker.update(dets)
+    total_time += time.time() - start_time
+
+    if len(trackers):
+      rows.append(np.column_stack((np.full(len(trackers), frame), trackers[:, 4], trackers[:, :2], trackers[:, 2:4] - trackers[:, :2])))
+
+    if(viewer):
+      viewer.draw_tracks(trackers)
+      viewer.flush()
+
+  with open(os.path.join(output_dir, '%s.txt'%(seq)),'w') as out_file:
+    if rows:
+      np.savetxt(out_file, np.concatenate(rows), fmt=MOT_ROW)
+  return seq, total_time, len(frames)
+
 
 def parse_args():
     """Parse input arguments."""
@@ -265,6 +502,8 @@ def parse_args():
                         help="Minimum number of associated detections before track is initialised.", 
                         type=int, default=3)
     parser.add_argument("--iou_threshold", help="Minimum IOU for match.", type=float, default=0.3)
+    parser.add_argument("--workers", help="Processes to spread sequences over, 0 for one per CPU. Ignored with --display [1].", type=int, default=1)
+    parser.add_argument("--output", help="Directory for the tracking results.", type=str, default='output')
     args = parser.parse_args()
     return args
 
@@ -275,56 +514,46 @@ if __name__ == '__main__':
   phase = args.phase
   total_time = 0.0
   total_frames = 0
-  colours = np.random.rand(32, 3) #used only for display
+  viewer = None
   if(display):
     if not os.path.exists('mot_benchmark'):
       print('\n\tERROR: mot_benchmark link not found!\n\n    Create a symbolic link to the MOT benchmark\n    (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n    $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n')
       exit()
-    plt.ion()
-    fig = plt.figure()
-    ax1 = fig.add_subplot(111, aspect='equal')
-
-  if not os.path.exists('output'):
-    os.makedirs('output')
+    # matplotlib and skimage are only loaded when something is actually shown
+    try:
+      from modules.sort_display import SequenceDisplay
+    except ImportError:
+      from sort_display import SequenceDisplay
+    viewer = SequenceDisplay(phase)
+
+  if not os.path.exists(args.output):
+    os.makedirs(args.output)
   pattern = os.path.join(args.seq_path, phase, '*', 'det', 'det.txt')
-  for seq_dets_fn in glob.glob(pattern):
-    mot_tracker = Sort(max_age=args.max_age, 
-                       min_hits=args.min_hits,
-                       iou_threshold=args.iou_threshold) #create instance of the SORT tracker
-    seq_dets = np.loadtxt(seq_dets_fn, delimiter=',')
-    seq = seq_dets_fn[pattern.find('*'):].split(os.path.sep)[0]
-    
-    with open(os.path.join('output', '%s.txt'%(seq)),'w') as out_file:
+  jobs = [(seq_dets_fn, seq_dets_fn[pattern.find('*'):].split(os.path.sep)[0]) for seq_dets_fn in sorted(glob.glob(pattern))]
+  params = (args.output, args.max_age, args.min_hits, args.iou_threshold)
+  workers = args.workers or os.cpu_count()
+
+  wall_start = time.time()
+  if display or workers <= 1 or len(jobs) <= 1:
+    results = []
+    for seq_dets_fn, seq in jobs:
       print("Processing %s."%(seq))
-      for frame in range(int(seq_dets[:,0].max())):
-        frame += 1 #detection and frame numbers begin at 1
-        dets = seq_dets[seq_dets[:, 0]==frame, 2:7]
-        dets[:, 2:4] += dets[:, 0:2] #convert to [x1,y1,w,h] to [x1,y1,x2,y2]
-        total_frames += 1
-
-        if(display):
-          fn = os.path.join('mot_benchmark', phase, seq, 'img1', '%06d.jpg'%(frame))
-          im =io.imread(fn)
-          ax1.imshow(im)
-          plt.title(seq + ' Tracked Targets')
-
-        start_time = time.time()
-        trackers = mot_tracker.update(dets)
-        cycle_time = time.time() - start_time
-        total_time += cycle_time
-
-        for d in trackers:
-          print('%d,%d,%.2f,%.2f,%.2f,%.2f,1,-1,-1,-1'%(frame,d[4],d[0],d[1],d[2]-d[0],d[3]-d[1]),file=out_file)
-          if(display):
-            d = d.astype(np.int32)
-            ax1.add_patch(patches.Rectangle((d[0],d[1]),d[2]-d[0],d[3]-d[1],fill=False,lw=3,ec=colours[d[4]%32,:]))
-
-        if(display):
-          fig.canvas.flush_events()
-          plt.draw()
-          ax1.cla()
-
-  print("Total Tracking took: %.3f seconds for %d frames or %.1f FPS" % (total_time, total_frames, total_frames / total_time))
+      results.append(track_sequence(seq_dets_fn, seq, *params, viewer=viewer))
+  else:
+    # the pool is created once and its processes are reused for every sequence
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+      futures = [pool.submit(track_sequence, seq_dets_fn, seq, *params) for seq_dets_fn, seq in jobs]
+      results = []
+      for future in futures:
+        results.append(future.result())
+        print("Processed %s."%(results[-1][0]))
+  wall_time = time.time() - wall_start
+
+  for _, seq_time, seq_frames in results:
+    total_time += seq_time
+    total_frames += seq_frames
+  print("Total Tracking took: %.3f seconds for %d frames or %.1f FPS" % (total_time, total_frames, total_frames / max(total_time, 1e-9)))
+  print("Wall time: %.3f seconds over %d sequence(s) with %d worker(s)" % (wall_time, len(jobs), 1 if display else min(workers, max(len(jobs), 1))))
 
   if(display):
     print("Note: to get real runtime results run without the option: --display")
@@ -0,0 +1,42 @@
+"""
+    Display helpers for the SORT demo in modules/sort.py.
+
+    Kept out of the tracker core so that importing modules.sort never pulls in
+    matplotlib, a Tk backend or scikit-image. Only `python sort.py --display` loads this.
+"""
+import os
+import numpy as np
+import matplotlib
+matplotlib.use('TkAgg')
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+from skimage import io
+
+
+class SequenceDisplay(object):
+  """
+  Shows each MOT benchmark frame with the tracked boxes drawn on top.
+  """
+  def __init__(self, phase, benchmark_path='mot_benchmark'):
+    self.phase = phase
+    self.benchmark_path = benchmark_path
+    self.colours = np.random.RandomState(0).rand(32, 3)
+    plt.ion()
+    self.fig = plt.figure()
+    self.ax1 = self.fig.add_subplot(111, aspect='equal')
+
+  def show_frame(self, seq, frame):
+    fn = os.path.join(self.benchmark_path, self.phase, seq, 'img1', '%06d.jpg'%(frame))
+    im = io.imread(fn)
+    self.ax1.imshow(im)
+    plt.title(seq + ' Tracked Targets')
+
+  def draw_tracks(self, trackers):
+    for d in trackers:
+      d = d.astype(np.int32)
+      self.ax1.add_patch(patches.Rectangle((d[0],d[1]),d[2]-d[0],d[3]-d[1],fill=False,lw=3,ec=self.colours[d[4]%32,:]))
+
+  def flush(self):
+    self.fig.canvas.flush_events()
+    plt.draw()
+    self.ax1.cla()
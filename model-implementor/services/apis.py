@@ -1,14 +1,165 @@
+import asyncio
+import json
+import random
 import httpx
 
 API_URL = "http://127.0.0.1:8080/api/v1/accident/create"
+BATCH_API_URL = "http://127.0.0.1:8080/api/v1/accident/create/batch"
 SEND_MAIL_URL = "http://127.0.0.1:8080/api/v1/emails/send-email"
 
+# Worth retrying: the server is restarting or overloaded, everything else is final
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class AlertClient(object):
+    """
+    One pooled HTTP client for everything the detector sends to the server.
+
+    Connections are kept alive and reused, at most `concurrency` requests are in
+    flight, and failed requests are retried with exponential backoff. Requests run
+    as tracked background tasks so the caller never waits on the network; close()
+    drains them. With `batchSize` > 1 accident records arriving within `batchDelay`
+    seconds of each other are posted together to the batch endpoint.
+
+    Accident snapshots are sent as raw JPEG parts of a multipart request, with the
+    record itself as JSON in the 'data' field.
+    """
+
+    def __init__(self, concurrency=4, maxConnections=8, retries=3, backoff=0.5, timeout=10.0, batchSize=1, batchDelay=0.5):
+        self.concurrency = concurrency
+        self.maxConnections = maxConnections
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.batchSize = batchSize
+        self.batchDelay = batchDelay
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self._client = None
+        self._semaphore = None
+        self._tasks = set()
+        self._pending = []
+        self._flushTask = None
+
+    @property
+    def client(self):
+        # created on first use so it belongs to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.maxConnections, max_keepalive_connections=self.maxConnections),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._client
+
+    async def post(self, url, payload, frames=None):
+        """
+        Posts `payload` as JSON, or with `frames` (a list of JPEG bytes) as a multipart
+        form, retrying transport errors and RETRY_STATUSES.
+        Returns the last response, or raises the last transport error.
+        """
+        client = self.client
+        if frames:
+            form = {"data": json.dumps(payload)}
+            files = [("frame", ("frame.jpg", frame, "image/jpeg")) for frame in frames]
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    if frames:
+                        response = await client.post(url, data=form, files=files)
+                    else:
+                        response = await client.post(url, json=payload)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    self.sent += 1
+                    return response
+                if attempt == self.retries:
+                    response.raise_for_status()
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            self.retried += 1
+            await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    def submit(self, coro):
+        """
+        Runs `coro` as a background task that close() waits for.
+        """
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+            print("[alerts] request failed:", repr(task.exception()))
+
+    def post_accident(self, data, frame=None):
+        """
+        Sends the accident record, `frame` is its JPEG snapshot (bytes or a buffer).
+        """
+        frame = bytes(frame) if frame is not None else None
+        if self.batchSize <= 1:
+            return self.submit(self.post(API_URL, data, [frame] if frame is not None else None))
+        if self._pending and (self._pending[0][1] is None) != (frame is None):
+            # a batch is either all multipart or all legacy JSON
+            self.flush()
+        self._pending.append((data, frame))
+        if len(self._pending) >= self.batchSize:
+            self.flush()
+        elif self._flushTask is None:
+            self._flushTask = asyncio.get_running_loop().call_later(self.batchDelay, self.flush)
+
+    def flush(self):
+        """
+        Posts the queued accident records as one batch.
+        """
+        if self._flushTask is not None:
+            self._flushTask.cancel()
+            self._flushTask = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        frames = [frame for _, frame in batch] if batch[0][1] is not None else None
+        return self.submit(self.post(BATCH_API_URL, {"accidents": [data for data, _ in batch]}, frames))
+
+    def send_mail(self, latitude, longitude, severity, location):
+        return self.submit(self.post(SEND_MAIL_URL, {"latitude": latitude, "longitude": longitude, "severity": severity, "location": location}))
+
+    def pending(self):
+        return len(self._tasks) + len(self._pending)
+
+    async def close(self, timeout=30):
+        """
+        Sends whatever is still batched, waits up to `timeout` seconds for the
+        in-flight requests and closes the connections.
+        """
+        self.flush()
+        if self._tasks:
+            done, notDone = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in notDone:
+                task.cancel()
+            if notDone:
+                print("[alerts] gave up on %d request(s) at shutdown" % len(notDone))
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def summary(self):
+        return {"sent": self.sent, "retried": self.retried, "failed": self.failed, "batches": self.batches, "inFlight": self.pending()}
+
+
+_default = AlertClient()
+
+
 async def post_accident_data(data):
-    async with httpx.AsyncClient() as client:
-        response = await client.post(API_URL, json=data)
-        return response
-    
+    return await _default.post(API_URL, data)
+
+
 async def send_mail_async_final(latitude, longitude, severity, location):
-    async with httpx.AsyncClient() as client:
-        response = await client.post(SEND_MAIL_URL, json={"latitude": latitude, "longitude": longitude, "severity": severity, "location": location})
-        return response
\ No newline at end of file
+    return await _default.post(SEND_MAIL_URL, {"latitude": latitude, "longitude": longitude, "severity": severity, "location": location})
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import httpx
+from services.apis import API_URL, BATCH_API_URL, SEND_MAIL_URL
+
+PENDING = "pending"
+ACKED = "acked"
+DEAD = "dead"
+
+ACCIDENT = "accident"
+MAIL = "mail"
+URLS = {ACCIDENT: API_URL, MAIL: SEND_MAIL_URL}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    frame BLOB,
+    createdAt REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updatedAt REAL
+);
+CREATE INDEX IF NOT EXISTS events_pending ON events (id) WHERE status = 'pending';
+"""
+
+
+class Outbox(object):
+    """
+    Durable, append-only queue of alerts in a SQLite file (WAL mode).
+
+    The alert stage only appends a row, which never waits on the network. drain()
+    delivers the pending rows to the server oldest first, at most `rate` requests a
+    second, and marks each one acked once the server accepted it. When the server is
+    down the oldest row is retried every `retryDelay` seconds and nothing behind it is
+    sent, so alerts arrive in order. Rows the server rejects outright (4xx) are marked
+    dead instead of blocking the queue, and so are rows that failed `maxAttempts` times
+    (5xx or unreachable), so one payload the server keeps failing on cannot hold back
+    every alert behind it. Dead rows stay in the file. Anything still pending when the process exits
+    is delivered after the next start.
+    """
+
+    def __init__(self, path="./outbox.db", rate=5.0, retryDelay=5.0, maxAttempts=30, keepAckedSeconds=86400, shutdownTimeout=30):
+        self.path = path
+        self.rate = rate
+        self.retryDelay = retryDelay
+        self.maxAttempts = maxAttempts
+        self.keepAckedSeconds = keepAckedSeconds
+        self.shutdownTimeout = shutdownTimeout
+        self.appended = 0
+        self.delivered = 0
+        self.dead = 0
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._stopping = False
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # an fsync per checkpoint instead of per append, a power cut may lose the last few rows
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        if "frame" not in [column[1] for column in self._db.execute("PRAGMA table_info(events)")]:
+            # outbox files written before snapshots were stored as binary
+            self._db.execute("ALTER TABLE events ADD COLUMN frame BLOB")
+        self.replayed = self.backlog()
+        if self.replayed:
+            print("[outbox] %d undelivered alert(s) from a previous run in %s" % (self.replayed, path))
+
+    def append(self, kind, payload, frame=None):
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO events (kind, payload, frame, createdAt) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), frame, time.time()),
+            )
+        self.appended += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return cursor.lastrowid
+
+    # Same interface as services.apis.AlertClient, so the alert stage can use either
+    def post_accident(self, data, frame=None):
+        return self.append(ACCIDENT, data, frame)
+
+    def send_mail(self, latitude, longitude, severity, location):
+        return self.append(MAIL, {"latitude": latitude, "longitude": longitude, "severity": severity, "location": location})
+
+    def next_pending(self, limit=1):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, kind, payload, frame FROM events WHERE status = ? ORDER BY id LIMIT ?", (PENDING, limit)
+            ).fetchall()
+        return [(id, kind, json.loads(payload), frame) for id, kind, payload, frame in rows]
+
+    def mark(self, ids, status):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE events SET status = ?, attempts = attempts + 1, updatedAt = ? WHERE id = ?",
+                [(status, time.time(), id) for id in ids],
+            )
+
+    def touch(self, ids):
+        with self._lock:
+            self._db.executemany("UPDATE events SET attempts = attempts + 1, updatedAt = ? WHERE id = ?", [(time.time(), id) for id in ids])
+
+    def give_up(self, ids):
+        """
+        Marks the rows of `ids` that reached maxAttempts dead, returns how many there were.
+        """
+        if not self.maxAttempts:
+            return 0
+        with self._lock:
+            cursor = self._db.executemany(
+                "UPDATE events SET status = ?, updatedAt = ? WHERE id = ? AND status = ? AND attempts >= ?",
+                [(DEAD, time.time(), id, PENDING, self.maxAttempts) for id in ids],
+            )
+        return cursor.rowcount
+
+    def prune(self):
+        """
+        Deletes acked rows older than keepAckedSeconds, dead rows are kept for inspection.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM events WHERE status = ? AND updatedAt < ?", (ACKED, time.time() - self.keepAckedSeconds))
+
+    def backlog(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM events WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def _next_request(self, batchSize):
+        """
+        Returns (ids, url, payload, frames) for the oldest pending row, folding the run of
+        accident rows right behind it into one batch request when batchSize > 1.
+        """
+        rows = self.next_pending(max(1, batchSize))
+        if not rows:
+            return None
+        id, kind, payload, frame = rows[0]
+        if kind != ACCIDENT or batchSize <= 1:
+            return [id], URLS[kind], payload, [frame] if frame is not None else None
+        # a batch is either all multipart or all legacy JSON, so it stops where that changes
+        batch = []
+        for id, kind, payload, frame in rows:
+            if kind != ACCIDENT or (frame is None) != (rows[0][3] is None):
+                break
+            batch.append((id, payload, frame))
+        frames = [frame for _, _, frame in batch] if rows[0][3] is not None else None
+        if len(batch) == 1:
+            return [id for id, _, _ in batch], API_URL, batch[0][1], frames
+        return [id for id, _, _ in batch], BATCH_API_URL, {"accidents": [payload for _, payload, _ in batch]}, frames
+
+    async def drain(self, client):
+        """
+        Delivers pending rows through `client` (an AlertClient) until stop() is called.
+        """
+        self._wakeup = asyncio.Event()
+        interval = 1.0 / self.rate if self.rate else 0.0
+        lastPrune = 0.0
+        while True:
+            request = self._next_request(client.batchSize)
+            if request is None:
+                if self._stopping:
+                    return
+                if time.time() - lastPrune > 3600:
+                    lastPrune = time.time()
+                    self.prune()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            ids, url, payload, frames = request
+            startTime = time.time()
+            try:
+                await client.post(url, payload, frames)
+                self.mark(ids, ACKED)
+                self.delivered += len(ids)
+            except httpx.HTTPStatusError as e:
+                if 400 <= e.response.status_code < 500:
+                    print("[outbox] server rejected alert(s) %s: %s" % (ids, e.response.status_code))
+                    self.mark(ids, DEAD)
+                    self.dead += len(ids)
+                else:
+                    if not await self._retry_later(ids):
+                        return
+            except httpx.TransportError as e:
+                print("[outbox] server unreachable, retrying in %gs: %r" % (self.retryDelay, e))
+                if not await self._retry_later(ids):
+                    return
+            await asyncio.sleep(max(0.0, interval - (time.time() - startTime)))
+
+    async def _retry_later(self, ids):
+        """
+        Keeps the rows pending and waits retryDelay, or marks them dead once they used up
+        maxAttempts. Returns False when shutting down, the rest is then left for the next run.
+        """
+        self.touch(ids)
+        given = self.give_up(ids)
+        if given:
+            print("[outbox] giving up on %d alert(s) of %s after %d attempts" % (given, ids, self.maxAttempts))
+            self.dead += given
+        if self._stopping:
+            return False
+        if not given:
+            await asyncio.sleep(self.retryDelay)
+        return True
+
+    async def stop(self, task, timeout=None):
+        """
+        Lets `task` (the running drain()) deliver what is pending for up to `timeout`
+        seconds [shutdownTimeout], then cancels it. Undelivered rows stay in the file.
+        """
+        timeout = self.shutdownTimeout if timeout is None else timeout
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        try:
+            await asyncio.wait_for(task, timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        left = self.backlog()
+        if left:
+            print("[outbox] %d alert(s) left in %s, they are sent on the next start" % (left, self.path))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def summary(self):
+        return {"appended": self.appended, "delivered": self.delivered, "dead": self.dead, "backlog": self.backlog(), "replayed": self.replayed}
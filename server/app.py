@@ -1,10 +1,9 @@
 import os
 import datetime
-import requests
+import zlib
 from flask import Flask, jsonify, send_from_directory, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from pymongo import MongoClient
 from dotenv import load_dotenv
 
 # Load env vars
@@ -18,12 +17,14 @@ app.config["UPLOAD_FOLDER"] = "static/videos"
 # Enable CORS
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
-# MongoDB Atlas Connection
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-mongo_db = client["accidentDb"]
-users_collection = mongo_db.users
-accidents_collection = mongo_db.accidents
+# MongoDB Atlas Connection: one pool per process, opened on first use (MONGO_* settings in services/db.py)
+from services.db import collection, get_db, on_connect, pool_stats
+from services.telemetry import MOBILE_EVENT_COLLECTION, PayloadTooLarge, ensure_timeseries, insert_events, parse_events, read_events
+# SOS alerts and telemetry, a time-series collection with one series per userId
+mobile_events_collection = collection(MOBILE_EVENT_COLLECTION)
+MOBILE_EVENT_TTL_SECONDS = float(os.getenv("MOBILE_EVENT_TTL_DAYS", "90")) * 86400
+MAX_BULK_BYTES = int(os.getenv("MAX_BULK_BYTES", str(16 * 1024 * 1024)))
+MAX_BULK_EVENTS = int(os.getenv("MAX_BULK_EVENTS", "10000"))
 
 # JWT Auth
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
@@ -39,38 +40,27 @@ cloudinary.config(
 )
 
 # Import Blueprints
+from services.geo import point
 from blueprints.auth.auth import auth_bp
-from blueprints.accident.accident import accident_bp
+from blueprints.accident.accident import accident_bp, response_cache
 from blueprints.public.public import public_bp
-from blueprints.emails.emails import emails
+from blueprints.emails.emails import alert_dispatcher, emails, incidents, report_alert
+from blueprints.stats.stats import stats_bp
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(accident_bp)
 app.register_blueprint(public_bp)
 app.register_blueprint(emails)
+app.register_blueprint(stats_bp)
+
+@on_connect
+def ensure_mobile_event_collection():
+    ensure_timeseries(get_db(), MOBILE_EVENT_TTL_SECONDS)
 
 # -----------------------------
-# 🚀 BREVO EMAIL SENDER (NEW)
+# 🚀 BREVO EMAIL SENDER
 # -----------------------------
-def send_brevo_mail(to_email, subject, html):
-    url = "https://api.brevo.com/v3/smtp/email"
-
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "api-key": os.getenv("BREVO_API_KEY")
-    }
-
-    payload = {
-        "sender": {"name": "AccidentApp Alerts", "email": os.getenv("SENDER_EMAIL")},
-        "to": [{"email": to_email}],
-        "subject": subject,
-        "htmlContent": html
-    }
-
-    response = requests.post(url, json=payload, headers=headers)
-    print("📧 Brevo Response:", response.text)
-    return response.status_code
+# SOS mail is sent by the alert dispatcher (services/alerts.py) over a pooled Brevo session
 
 
 # -----------------------------
@@ -81,6 +71,24 @@ def home():
     return jsonify({"msg": "Server is running successfully!"})
 
 
+# Connection pool usage of this worker process, for sizing workers against the cluster's connection limit
+@app.route("/metrics/db")
+def db_metrics():
+    return jsonify(pool_stats())
+
+
+# Hit rate of the accident response cache in this worker process
+@app.route("/metrics/cache")
+def cache_metrics():
+    return jsonify(response_cache.stats())
+
+
+# Alert mail queue of this worker process: backlog, retries, dead letters and delivery latency
+@app.route("/metrics/alerts")
+def alert_metrics():
+    return jsonify(dict(alert_dispatcher.stats(), incidents=incidents.stats()))
+
+
 # ------------------------------------
 # 🚨 MOBILE SOS ALERT ENDPOINT
 # ------------------------------------
@@ -97,13 +105,15 @@ def mobile_sos():
                 return jsonify({"ok": False, "error": f"Missing {f}"}), 400
 
         # Save to DB
-        mongo_db.mobile_alerts.insert_one({
+        mobile_events_collection.insert_one({
             "userId": data["userId"],
+            "type": "sos",
             "lat": data["lat"],
             "lng": data["lng"],
             "speedKmph": data["speedKmph"],
             "accelG": data["accelG"],
-            "timestamp": datetime.datetime.utcnow().isoformat()
+            "location": point(data["lat"], data["lng"]),
+            "timestamp": datetime.datetime.utcnow()
         })
 
         # Email Content
@@ -117,21 +127,71 @@ def mobile_sos():
         <p><b>Time:</b> {datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}</p>
         """
 
-        # Send email using Brevo
-        send_status = send_brevo_mail(
-            os.getenv("SENDTO"),
-            "🚨 Accident Detected by AccidentApp",
-            html
-        )
-
-        print("📨 Email Status:", send_status)
-        return jsonify({"ok": True, "message": "SOS processed"}), 200
+        # Send email using Brevo, in the background so the phone gets its answer right away
+        # repeated SOS from the same place are folded into one incident and one digest
+        try:
+            incidentId = report_alert("mobile", "brevo", {
+                "to": [os.getenv("SENDTO")],
+                "subject": "🚨 Accident Detected by AccidentApp",
+                "html": html
+            }, data["lat"], data["lng"], details={"userId": data["userId"], "speedKmph": data["speedKmph"], "accelG": data["accelG"]})
+            queued = True
+        except Exception:
+            # the SOS is saved either way, a full queue leaves the mail in the dead letters
+            incidentId, queued = None, False
+        return jsonify({"ok": True, "message": "SOS processed", "queued": queued, "incidentId": incidentId}), 200
 
     except Exception as e:
         print("❌ SOS Error:", e)
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+# ------------------------------------
+# 📦 MOBILE BULK EVENT INGEST
+# ------------------------------------
+@app.route("/api/mobile/events/bulk", methods=["POST"])
+def mobile_events_bulk():
+    """
+    Stores a burst of buffered phone events: NDJSON (or a JSON array), optionally gzipped
+    with Content-Encoding: gzip. Every line is {userId, lat, lng, speedKmph, accelG} plus an
+    optional timestamp, heading, accuracyM and type ("telemetry" or "sos"). Valid events are
+    stored even when others are not, the answer lists every rejected line by index.
+    """
+    if (request.content_length or 0) > MAX_BULK_BYTES:
+        return jsonify({"ok": False, "error": f"Body larger than {MAX_BULK_BYTES} bytes"}), 413
+    try:
+        events = read_events(request.get_data(), request.headers.get("Content-Encoding") == "gzip", MAX_BULK_BYTES)
+    except PayloadTooLarge as e:
+        return jsonify({"ok": False, "error": f"Body {e}"}), 413
+    except (ValueError, zlib.error) as e:
+        return jsonify({"ok": False, "error": f"Unreadable body: {e}"}), 400
+    if not isinstance(events, list) or len(events) > MAX_BULK_EVENTS:
+        return jsonify({"ok": False, "error": f"Expected at most {MAX_BULK_EVENTS} events"}), 413
+
+    now = datetime.datetime.utcnow()
+    documents, indexes, errors = parse_events(events, now)
+    insertErrors = insert_events(mobile_events_collection, documents, indexes)
+    errors += insertErrors
+
+    # buffered SOS still raise an alert while their incident could be open
+    failed = {error["index"] for error in insertErrors}
+    for index, event in zip(indexes, documents):
+        if event["type"] == "sos" and index not in failed and (now - event["timestamp"]).total_seconds() <= incidents.windowSeconds:
+            try:
+                incidents.record("mobile", event["lat"], event["lng"], recipient=("brevo", os.getenv("SENDTO")),
+                                 details={"userId": event["userId"], "speedKmph": event["speedKmph"], "accelG": event["accelG"]})
+            except Exception as e:
+                print("❌ Bulk SOS alert error:", e)
+
+    errors.sort(key=lambda error: error["index"])
+    return jsonify({
+        "ok": not errors,
+        "accepted": len(events) - len(errors),
+        "rejected": len(errors),
+        "errors": errors
+    }), 200 if len(errors) < len(events) or not events else 400
+
+
 # Run app
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5050, debug=True)
@@ -0,0 +1,294 @@
+"""
+Benchmark suite for the server API, in process against local stand-ins.
+
+Boots server/app.py with MongoDB replaced by mongomock, Cloudinary by a fake uploader
+and mail by the fake sink (see benchmarks/standins.py), seeds it, and drives every
+endpoint through Flask test clients from --threads threads:
+
+    all      GET  /api/v1/accident/all?limit=50                  20/s
+    detail   GET  /api/v1/accident/<id>                          100/s
+    login    POST /api/v1/auth/login                             100/s
+    sos      POST /api/mobile/sos                                 50/s
+    create   POST /api/v1/accident/create with a multipart frame  50/s
+
+create runs last so the reads always see the same seeded records. Requests are sent
+open loop at the rate above (or --rate for all of them) for --duration seconds,
+each rate leaves headroom below what the endpoint handles on one CPU. Latency
+counts from the moment a request was due, so time spent waiting for a free thread
+shows up when the server falls behind. --rate 0 instead runs the threads flat out
+and measures the capacity. Per endpoint it reports throughput, latency percentiles,
+failures and the peak memory traced over --memory_requests extra requests.
+
+    python benchmarks/api_bench.py                                # all endpoints
+    python benchmarks/api_bench.py --repeat 3 --save benchmarks/baselines/api.json
+    python benchmarks/api_bench.py --repeat 3 --compare benchmarks/baselines/api.json
+
+With --compare the exit code is 1 when an endpoint's p50 or throughput regresses by
+more than --tolerance, its p99 by more than --p99_tolerance or it starts failing,
+so it can gate CI. --repeat keeps the median of several rounds, so one noisy round
+does not fail the build. Baselines are machine specific, regenerate them on the box
+that runs the comparison. Needs mongomock and numpy.
+"""
+import argparse
+import atexit
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+from benchmarks import standins  # noqa: E402
+
+FRAME = bytes(random.Random(0).getrandbits(8) for _ in range(20 * 1024))
+ACCIDENT_IDS = [f"{i + 1:024x}" for i in range(standins.SEED_ACCIDENTS)]
+
+
+def create_request(client):
+    data = {"address": "Bench street", "city": "Kathmandu", "latitude": 27.7, "longitude": 85.3, "severityInPercentage": 70, "severity": "Moderate"}
+    return client.post("/api/v1/accident/create", data={"data": json.dumps(data), "frame": (io.BytesIO(FRAME), "frame.jpg")}, content_type="multipart/form-data")
+
+
+def all_request(client):
+    return client.get("/api/v1/accident/all?limit=50")
+
+
+def detail_request(client):
+    return client.get(f"/api/v1/accident/{random.choice(ACCIDENT_IDS)}")
+
+
+def login_request(client):
+    return client.post("/api/v1/auth/login", json={"email": standins.SEED_USER["email"], "password": standins.SEED_USER["password"]})
+
+
+def sos_request(client):
+    return client.post("/api/mobile/sos", json={"userId": f"user{random.randrange(1000)}", "lat": 27.7, "lng": 85.3, "speedKmph": 60, "accelG": 4.5})
+
+
+# name -> (request, requests per second), in the order they run
+ENDPOINTS = {
+    "all": (all_request, 20.0),
+    "detail": (detail_request, 100.0),
+    "login": (login_request, 100.0),
+    "sos": (sos_request, 50.0),
+    "create": (create_request, 50.0),
+}
+
+
+def boot(args):
+    """
+    Imports the app wired to the stand-ins and seeds it, returns the Flask app.
+    """
+    # the app resolves its relative paths against the working directory, but frames, images and
+    # mail go to a scratch directory: a real server would upload spooled frames to Cloudinary
+    os.chdir(SERVER_DIR)
+    scratchDir = tempfile.mkdtemp(prefix="api-bench-")
+    atexit.register(shutil.rmtree, scratchDir, ignore_errors=True)
+    os.environ.update(standins.standin_environment(args.mongo_latency_ms, args.upload_delay_ms, args.mail_delay_ms, scratchDir))
+    os.environ["IMAGE_UPLOADER"] = "cloudinary"
+    os.environ["CACHE_TTL_SECONDS"] = os.environ["CACHE_TTL_SECONDS"] if args.cache else "0"
+    standins.install()
+    standins.fake_cloudinary(args.upload_delay_ms)
+    from app import app
+    from services.db import get_db
+    standins.seed(get_db())
+    return app
+
+
+class Clients(threading.local):
+    # Flask test clients keep cookies, one per thread
+    def __init__(self, app):
+        self.client = app.test_client()
+
+
+def timed(request, clients, dueAt):
+    try:
+        ok = request(clients.client).status_code < 400
+    except Exception:
+        ok = False
+    finishedAt = time.perf_counter()
+    return finishedAt - dueAt, finishedAt, ok
+
+
+def run_open_loop(request, clients, rate, duration, threads):
+    count = max(1, int(rate * duration))
+    startTime = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(threads) as pool:
+        for i in range(count):
+            dueAt = startTime + i / rate
+            wait = dueAt - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            futures.append(pool.submit(timed, request, clients, dueAt))
+        results = [future.result() for future in futures]
+    return results, max(finishedAt for _, finishedAt, _ in results) - startTime
+
+
+def run_closed_loop(request, clients, duration, threads):
+    startTime = time.perf_counter()
+    deadline = startTime + duration
+
+    def user():
+        results = []
+        while time.perf_counter() < deadline:
+            results.append(timed(request, clients, time.perf_counter()))
+        return results
+
+    with ThreadPoolExecutor(threads) as pool:
+        results = [result for futures in [pool.submit(user) for _ in range(threads)] for result in futures.result()]
+    return results, time.perf_counter() - startTime
+
+
+def latency_summary(samples):
+    samples = np.asarray(samples) * 1000 if len(samples) else np.zeros(1)
+    return {
+        "meanMs": float(samples.mean()),
+        "p50Ms": float(np.percentile(samples, 50)),
+        "p90Ms": float(np.percentile(samples, 90)),
+        "p99Ms": float(np.percentile(samples, 99)),
+        "maxMs": float(samples.max()),
+    }
+
+
+def rss_mib():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def bench_endpoint(name, clients, args):
+    request, rate = ENDPOINTS[name]
+    rate = rate if args.rate is None else args.rate
+    for _ in range(args.warmup):
+        timed(request, clients, time.perf_counter())
+
+    if rate:
+        results, elapsed = run_open_loop(request, clients, rate, args.duration, args.threads)
+    else:
+        results, elapsed = run_closed_loop(request, clients, args.duration, args.threads)
+    latencies = [latency for latency, _, ok in results if ok]
+    failures = sum(1 for _, _, ok in results if not ok)
+
+    tracemalloc.start()
+    for _ in range(args.memory_requests):
+        timed(request, clients, time.perf_counter())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return dict(
+        latency_summary(latencies),
+        requests=len(results),
+        failures=failures,
+        throughput=len(latencies) / elapsed,
+        peakMemoryKiB=peak / 1024.0,
+        rssMiB=rss_mib(),
+    )
+
+
+def median_result(runs):
+    # the median round of each statistic, any failure in any round counts
+    result = {key: float(np.median([run[key] for run in runs])) for key in runs[0] if runs[0][key] is not None and key != "failures"}
+    result["failures"] = max(run["failures"] for run in runs)
+    result["rssMiB"] = result.get("rssMiB")
+    return result
+
+
+def compare(results, baseline, tolerance, p99Tolerance, minDeltaMs):
+    """
+    Prints the changes against the baseline and returns the list of regressions: a p50
+    slower by more than `tolerance` or a p99 slower by more than `p99Tolerance`, either
+    by at least `minDeltaMs`, a throughput that dropped by more than `tolerance`, or
+    new failures.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("endpoints", {}).get(name)
+        if base is None:
+            continue
+        for stat, allowed in (("p50Ms", tolerance), ("p99Ms", p99Tolerance)):
+            before, after = base[stat], result[stat]
+            change = (after - before) / before if before else 0.0
+            flag = "REGRESSION" if change > allowed and after - before >= minDeltaMs else ""
+            print("  %-8s %s        %8.2f ms -> %8.2f ms (%+6.1f%%) %s" % (name, stat[:3], before, after, change * 100, flag))
+            if flag:
+                regressions.append((name, stat, change))
+        before, after = base["throughput"], result["throughput"]
+        change = (after - before) / before if before else 0.0
+        flag = "REGRESSION" if change < -tolerance else ""
+        print("  %-8s throughput %8.1f /s -> %8.1f /s (%+6.1f%%) %s" % (name, before, after, change * 100, flag))
+        if flag:
+            regressions.append((name, "throughput", change))
+        if result["failures"] > base.get("failures", 0):
+            print("  %-8s failures   %8d    -> %8d    REGRESSION" % (name, base.get("failures", 0), result["failures"]))
+            regressions.append((name, "failures", result["failures"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server API benchmark suite")
+    parser.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS), help="Endpoint to run, repeatable [all].")
+    parser.add_argument("--rate", type=float, help="Requests per second for every endpoint instead of their own, 0 runs flat out.")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per endpoint.")
+    parser.add_argument("--threads", type=int, default=16, help="Threads sending requests.")
+    parser.add_argument("--repeat", type=int, default=1, help="Rounds per endpoint, the median of each statistic is kept [1].")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests before each endpoint.")
+    parser.add_argument("--memory_requests", type=int, default=50, help="Requests traced for the peak memory.")
+    parser.add_argument("--mongo_latency_ms", type=float, default=2.0, help="Simulated MongoDB round trip [2].")
+    parser.add_argument("--upload_delay_ms", type=float, default=800.0, help="Simulated Cloudinary upload time.")
+    parser.add_argument("--mail_delay_ms", type=float, default=300.0, help="Simulated mail provider latency.")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache on, it is off to measure the database path.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the results as a JSON baseline to this path.")
+    parser.add_argument("--compare", help="Compare against this JSON baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before failing [0.25].")
+    # the slowest 1% of a few hundred requests is a handful of them, one scheduler hiccup moves it
+    parser.add_argument("--p99_tolerance", type=float, default=2.0, help="Allowed relative p99 slowdown before failing [2.0].")
+    parser.add_argument("--min_delta_ms", type=float, default=1.0, help="Ignore slowdowns smaller than this [1 ms].")
+    args = parser.parse_args()
+    save = os.path.abspath(args.save) if args.save else None
+    baselinePath = os.path.abspath(args.compare) if args.compare else None
+
+    random.seed(args.seed)
+    clients = Clients(boot(args))
+    settings = {key: getattr(args, key) for key in ("rate", "duration", "repeat", "threads", "mongo_latency_ms", "upload_delay_ms", "mail_delay_ms", "cache")}
+
+    results = {}
+    for name in [name for name in ENDPOINTS if not args.endpoint or name in args.endpoint]:
+        result = results[name] = median_result([bench_endpoint(name, clients, args) for _ in range(max(1, args.repeat))])
+        print("%-8s %7.1f req/s  p50 %8.2f  p90 %8.2f  p99 %8.2f  max %8.2f ms  failed %d  peak %8.1f KiB  rss %s MiB" % (
+            name, result["throughput"], result["p50Ms"], result["p90Ms"], result["p99Ms"], result["maxMs"],
+            result["failures"], result["peakMemoryKiB"], "%.1f" % result["rssMiB"] if result["rssMiB"] else "-"))
+
+    if save:
+        os.makedirs(os.path.dirname(save), exist_ok=True)
+        with open(save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "settings": settings, "endpoints": results}, f, indent=2)
+        print("Saved baseline to %s" % save)
+
+    if baselinePath:
+        with open(baselinePath) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print("Note: baseline was taken with different settings %s" % baseline.get("settings"))
+        print("Compared with %s:" % baselinePath)
+        regressions = compare(results, baseline, args.tolerance, args.p99_tolerance, args.min_delta_ms)
+        if regressions:
+            print("%d regression(s)" % len(regressions))
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
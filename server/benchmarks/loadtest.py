@@ -0,0 +1,206 @@
+"""
+Load test of the backend under different gunicorn profiles, against local stand-ins.
+
+Each profile starts gunicorn on benchmarks.standin_app:app (MongoDB, Cloudinary and
+the mail providers replaced by benchmarks/standins.py, with simulated latency) and
+drives every scenario with --concurrency clients for --duration seconds, reporting
+requests per second and latency percentiles.
+
+    python benchmarks/loadtest.py                                  # today vs gthread
+    python benchmarks/loadtest.py --profile today --profile gevent --concurrency 256
+    python benchmarks/loadtest.py --mongo_latency_ms 20 --save loadtest.json
+
+Profiles:
+    today     gunicorn app:app as deployed before, one sync worker
+    sync      sync workers, as many as gunicorn.conf.py starts
+    gthread   gunicorn.conf.py as is
+    gevent    gunicorn.conf.py with GUNICORN_WORKER_CLASS=gevent (needs gevent)
+
+Needs mongomock and httpx. The load generator shares the CPUs with the server, so
+compare profiles run on the same box rather than absolute numbers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.standins import SEED_ACCIDENTS, standin_environment  # noqa: E402
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    # gunicorn turns sync into gthread when threads > 1, hence --threads 1
+    "today": (["--worker-class", "sync", "--workers", "1", "--threads", "1"], {}),
+    "sync": (["--worker-class", "sync", "--threads", "1"], {}),
+    "gthread": ([], {}),
+    "gevent": ([], {"GUNICORN_WORKER_CLASS": "gevent"}),
+}
+
+ACCIDENT_IDS = [f"{i + 1:024x}" for i in range(SEED_ACCIDENTS)]
+
+
+def detail_request(client):
+    return client.get(f"/api/v1/accident/{random.choice(ACCIDENT_IDS)}")
+
+
+def list_request(client):
+    return client.get("/api/v1/accident/all", params={"limit": 20, "city": random.choice(("Kathmandu", "Lalitpur"))})
+
+
+def sos_request(client):
+    return client.post("/api/mobile/sos", json={
+        "userId": f"user{random.randrange(1000)}",
+        "lat": 27.6 + random.random() * 0.2,
+        "lng": 85.2 + random.random() * 0.2,
+        "speedKmph": 60,
+        "accelG": 4.5,
+    })
+
+
+SCENARIOS = {
+    "detail": detail_request,
+    "list": list_request,
+    "sos": sos_request,
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(profile, port, environment, verbose=False):
+    arguments, profileEnvironment = PROFILES[profile]
+    env = dict(os.environ, **environment, **profileEnvironment)
+    command = [
+        sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+        "--bind", f"127.0.0.1:{port}", "--access-logfile", "/dev/null", *arguments,
+        "benchmarks.standin_app:app",
+    ]
+    output = None if verbose else subprocess.DEVNULL
+    server = subprocess.Popen(command, cwd=SERVER_DIR, env=env, stdout=output, stderr=output)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {server.returncode}, rerun with --verbose")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not come up within 60s")
+
+
+async def drive(baseUrl, request, concurrency, duration, timeout):
+    """
+    Runs `request` from `concurrency` clients for `duration` seconds, returns the
+    latencies of the successful requests and the number of failures.
+    """
+    latencies, failures = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=baseUrl, limits=limits, timeout=timeout) as client:
+        deadline = time.perf_counter() + duration
+
+        async def user():
+            nonlocal failures
+            while time.perf_counter() < deadline:
+                startTime = time.perf_counter()
+                try:
+                    response = await request(client)
+                    if response.status_code < 400:
+                        latencies.append(time.perf_counter() - startTime)
+                        continue
+                except httpx.HTTPError:
+                    pass
+                failures += 1
+
+        await asyncio.gather(*[user() for _ in range(concurrency)])
+    return latencies, failures
+
+
+def summarize(latencies, failures, duration):
+    samples = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies),
+        "failures": failures,
+        "rps": round(len(latencies) / duration, 1),
+        "p50Ms": round(float(np.percentile(samples, 50)), 1),
+        "p90Ms": round(float(np.percentile(samples, 90)), 1),
+        "p99Ms": round(float(np.percentile(samples, 99)), 1),
+        "maxMs": round(float(samples.max()), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend load test against local stand-ins")
+    parser.add_argument("--profile", action="append", choices=sorted(PROFILES), help="Gunicorn profile, repeatable [today, gthread].")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run, repeatable [all].")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario.")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of untimed load before each scenario.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Client timeout per request.")
+    parser.add_argument("--mongo_latency_ms", type=float, default=20.0, help="Simulated MongoDB round trip.")
+    parser.add_argument("--upload_delay_ms", type=float, default=800.0, help="Simulated image host latency.")
+    parser.add_argument("--mail_delay_ms", type=float, default=300.0, help="Simulated mail provider latency.")
+    parser.add_argument("--workers", type=int, help="WEB_CONCURRENCY for the profiles that read it.")
+    parser.add_argument("--threads", type=int, help="GUNICORN_THREADS for gthread.")
+    parser.add_argument("--save", help="Write the results as JSON to this path.")
+    parser.add_argument("--verbose", action="store_true", help="Show the gunicorn output.")
+    args = parser.parse_args()
+
+    # the servers spool frames and write images and mail here instead of server/instance
+    scratchDir = tempfile.mkdtemp(prefix="loadtest-")
+    environment = standin_environment(args.mongo_latency_ms, args.upload_delay_ms, args.mail_delay_ms, scratchDir)
+    # the response cache would hide the database, measure the uncached path
+    environment["CACHE_TTL_SECONDS"] = "0"
+    if args.workers:
+        environment["WEB_CONCURRENCY"] = str(args.workers)
+    if args.threads:
+        environment["GUNICORN_THREADS"] = str(args.threads)
+
+    try:
+        results = run_profiles(args, environment)
+    finally:
+        shutil.rmtree(scratchDir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print("Saved results to", args.save)
+
+
+def run_profiles(args, environment):
+    results = {}
+    print(f"{'profile':<9} {'scenario':<8} {'rps':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'failed':>7}")
+    for profile in args.profile or ["today", "gthread"]:
+        port = free_port()
+        server = start_server(profile, port, environment, args.verbose)
+        try:
+            results[profile] = {}
+            for name in args.scenario or sorted(SCENARIOS):
+                baseUrl = f"http://127.0.0.1:{port}"
+                if args.warmup:
+                    asyncio.run(drive(baseUrl, SCENARIOS[name], args.concurrency, args.warmup, args.timeout))
+                latencies, failures = asyncio.run(drive(baseUrl, SCENARIOS[name], args.concurrency, args.duration, args.timeout))
+                summary = results[profile][name] = summarize(latencies, failures, args.duration)
+                print(f"{profile:<9} {name:<8} {summary['rps']:>8} {summary['p50Ms']:>8} {summary['p90Ms']:>8} {summary['p99Ms']:>8} {summary['maxMs']:>8} {summary['failures']:>7}")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return results
+
+
+if __name__ == "__main__":
+    main()
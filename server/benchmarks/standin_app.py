@@ -0,0 +1,14 @@
+"""
+The backend wired to the local stand-ins (benchmarks/standins.py) and seeded with
+SEED_ACCIDENTS accidents, for gunicorn:
+
+    gunicorn -c gunicorn.conf.py benchmarks.standin_app:app
+"""
+from benchmarks import standins
+
+standins.install()
+
+from app import app  # noqa: E402,F401
+from services.db import get_db  # noqa: E402
+
+accidentIds = standins.seed(get_db())
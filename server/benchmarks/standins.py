@@ -0,0 +1,144 @@
+"""
+Local stand-ins for the services the backend talks to, so the benchmarks run on one
+box without Atlas, Cloudinary or a mail provider.
+
+MongoDB is replaced by mongomock (`pip install mongomock`) with `latencyMs` added to
+every operation to mimic the round trip to Atlas. mongomock guards its collections
+with its own reader/writer lock, the added sleep overlaps across threads like real
+network waits do.
+Images are stored locally (or handed to fake_cloudinary()) and mail goes to the fake
+sink, both after a configurable delay (IMAGE_UPLOAD_DELAY_MS, ALERT_FAKE_DELAY_MS).
+"""
+import functools
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+DATABASE_OPERATIONS = (
+    "find_one", "find", "insert_one", "insert_many", "update_one", "update_many", "delete_one",
+    "find_one_and_update", "aggregate", "count_documents", "create_index",
+)
+SEED_ACCIDENTS = 200
+SEED_USER = {"email": "bench@example.com", "password": "benchmark", "username": "bench"}
+
+
+def standin_environment(mongoLatencyMs=20.0, uploadDelayMs=800.0, mailDelayMs=300.0, scratchDir=None):
+    """
+    Environment for the server under test. Spooled frames, stored images and fake mail go
+    to `scratchDir`, never to server/instance: a real server started later would upload
+    frames left in its spool to Cloudinary.
+    """
+    environment = {
+        "STANDIN_MONGO_LATENCY_MS": str(mongoLatencyMs),
+        "IMAGE_UPLOADER": "local",
+        "IMAGE_UPLOAD_DELAY_MS": str(uploadDelayMs),
+        "ALERT_MAIL_SINK": "fake",
+        "ALERT_FAKE_DELAY_MS": str(mailDelayMs),
+        "SENDTO": "alerts@example.com",
+        "JWT_SECRET_KEY": "benchmark-only-secret-key-0123456789",
+    }
+    if scratchDir is not None:
+        environment.update({
+            "IMAGE_SPOOL_DIR": os.path.join(scratchDir, "uploads"),
+            "IMAGE_LOCAL_DIR": os.path.join(scratchDir, "accident_frames"),
+            "ALERT_FAKE_MAIL_PATH": os.path.join(scratchDir, "fake_mail.jsonl"),
+        })
+    return environment
+
+
+def install(latencyMs=None):
+    """
+    Makes pymongo.MongoClient a mongomock client with latencyMs per operation, call it
+    before the app is imported.
+    """
+    import mongomock
+    import mongomock.collection
+    import pymongo
+
+    latency = (float(os.getenv("STANDIN_MONGO_LATENCY_MS", "20")) if latencyMs is None else latencyMs) / 1000.0
+    nested = threading.local()
+
+    def delayed(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # one round trip per call of the app, not per call mongomock makes internally
+            if latency and not getattr(nested, "depth", 0):
+                time.sleep(latency)
+            nested.depth = getattr(nested, "depth", 0) + 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                nested.depth -= 1
+        return wrapper
+
+    for name in DATABASE_OPERATIONS:
+        setattr(mongomock.collection.Collection, name, delayed(getattr(mongomock.collection.Collection, name)))
+
+    shared = mongomock.MongoClient()
+
+    class StandinClient(object):
+        # every "connection" of the process sees the same in-memory data
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __getitem__(self, name):
+            return shared[name]
+
+        def __getattr__(self, name):
+            return getattr(shared, name)
+
+    pymongo.MongoClient = StandinClient
+    return shared
+
+
+def fake_cloudinary(delayMs=800.0):
+    """
+    Replaces cloudinary.uploader.upload, the uploader the server uses by default, with one
+    that only waits delayMs and returns a made up URL. Returns the list of uploaded paths.
+    """
+    import cloudinary.uploader
+    uploaded = []
+
+    def upload(path, **options):
+        time.sleep(delayMs / 1000.0)
+        uploaded.append(path)
+        name = os.path.basename(str(path)).split('.')[0]
+        return {"url": f"https://res.cloudinary.invalid/{options.get('folder', 'upload')}/{name}.jpg"}
+
+    cloudinary.uploader.upload = upload
+    return uploaded
+
+
+def seed(db, count=SEED_ACCIDENTS):
+    """
+    Inserts `count` accidents with fixed ids, so every worker process holds the same
+    records, and the SEED_USER account.
+    """
+    from bson import ObjectId
+    from services.geo import point
+    start = datetime(2024, 1, 1)
+    documents = []
+    for i in range(count):
+        latitude, longitude = 27.6 + (i % 100) * 0.002, 85.2 + (i // 100) * 0.002
+        documents.append({
+            "_id": ObjectId(f"{i + 1:024x}"),
+            "address": f"Street {i}",
+            "city": ("Kathmandu", "Lalitpur", "Bhaktapur")[i % 3],
+            "latitude": latitude,
+            "longitude": longitude,
+            "location": point(latitude, longitude),
+            "severityInPercentage": 40 + i % 60,
+            "severity": "Moderate",
+            "date": start + timedelta(minutes=17 * i),
+            "image_url": f"/static/accident_frames/{i}.jpg",
+            "image_status": "ready",
+        })
+    db["accidents"].insert_many(documents)
+    db["users"].insert_one({
+        "email": SEED_USER["email"],
+        "username": SEED_USER["username"],
+        "password": hashlib.sha256(SEED_USER["password"].encode('utf-8')).hexdigest(),
+    })
+    return [str(document["_id"]) for document in documents]
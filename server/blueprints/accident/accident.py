@@ -1,23 +1,32 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from datetime import datetime
 from bson import ObjectId
-from pymongo import MongoClient
 import base64
+import csv
+import hashlib
+import io
+import json
+import zlib
+from urllib.parse import urlencode
+from pymongo.errors import OperationFailure
 import cloudinary
 import cloudinary.api
-import cloudinary.uploader
 import os
 from dotenv import load_dotenv
+from services.cache import build_cache
+from services.db import collection, on_connect
+from services.geo import distance, ensure_geo_index, point, within_bbox, within_radius
+from services.rollups import ROLLUP_COLLECTION, record_accidents
+from services.uploads import PENDING, READY, UploadPool, build_uploader
 load_dotenv()
 
 # Blueprint setup
 accident_bp = Blueprint('accident', __name__, url_prefix='/api/v1/accident')
 
-# MongoDB setup
-client = MongoClient(os.getenv('MONGO_URI'))
-mongo_db = client['accidentDb']
-accidents_collection = mongo_db['accidents']
-users_collection = mongo_db['users']
+# MongoDB setup, the connection is shared by the whole app (services/db.py)
+accidents_collection = collection('accidents')
+users_collection = collection('users')
+rollups_collection = collection(ROLLUP_COLLECTION)
 
 # Cloudinary configuration
 cloudinary.config(
@@ -26,81 +35,460 @@ cloudinary.config(
     api_secret=os.getenv('API_SECRET')
 )
 
+# Single accident and list responses, invalidated on create and when an image upload finishes
+response_cache = build_cache()
+
+def invalidate_accident(accidentId=None):
+    if accidentId is not None:
+        response_cache.invalidate("accident", str(accidentId))
+    response_cache.invalidate("list")
+
+# Frames are uploaded in the background, records are saved with image_status "pending" until then
+upload_pool = UploadPool(
+    accidents_collection,
+    uploader=build_uploader(),
+    workers=int(os.getenv('IMAGE_UPLOAD_WORKERS', '4')),
+    spoolDir=os.getenv('IMAGE_SPOOL_DIR', 'instance/uploads'),
+    onUpdate=invalidate_accident,
+)
+
+def cached_json(namespace, key, build):
+    """
+    Answers with the JSON body cached under (namespace, key), or with the one `build()` returns
+    as (payload, status, cacheable), only cacheable 200s are stored. Every response carries an
+    ETag, a client sending it back in If-None-Match gets a 304 without a body.
+    """
+    entry = response_cache.get(namespace, key) if response_cache.ttl > 0 else None
+    if entry is not None:
+        body, etag = entry
+        response = Response(body, mimetype='application/json')
+    else:
+        payload, status, cacheable = build()
+        response = jsonify(payload)
+        response.status_code = status
+        if status != 200:
+            return response
+        if cacheable and response_cache.ttl > 0:
+            body, etag = response_cache.set(namespace, key, response.get_data())
+        else:
+            etag = hashlib.sha1(response.get_data()).hexdigest()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.make_conditional(request)
+    if response.status_code == 304:
+        response_cache.notModified += 1
+    return response
+
+def accident_document(accident_data):
+    document = {
+        "address": accident_data['address'],
+        "city": accident_data['city'],
+        "latitude": accident_data['latitude'],
+        "longitude": accident_data['longitude'],
+        "severityInPercentage": accident_data['severityInPercentage'],
+        "severity": accident_data['severity'],
+        "date": datetime.now(),
+        "image_url": None,
+        "image_status": PENDING
+    }
+    location = point(accident_data['latitude'], accident_data['longitude'])
+    if location is not None:
+        document["location"] = location
+    return document
+
+def queue_upload(accidentId, frame):
+    # frame is an uploaded file stream or the base64 string of the legacy JSON body
+    if isinstance(frame, str):
+        frame = base64.b64decode(frame)
+    upload_pool.submit(accidentId, frame)
+
+def read_accidents(key=None):
+    """
+    Returns the (accident_data, frame) pairs of a create request, either a multipart form with
+    a JSON 'data' field and the JPEG as 'frame' file(s), or the legacy JSON body carrying the
+    frame base64 encoded. With key, the records are the list under that key of the data.
+    """
+    if request.files:
+        payload = json.loads(request.form.get('data') or '{}')
+        frames = [frame.stream for frame in request.files.getlist('frame')]
+    else:
+        payload = request.get_json() or {}
+        frames = None
+    records = payload.get(key) if key else [payload]
+    if not isinstance(records, list):
+        return None
+    if frames is None:
+        frames = [record.get('frame', '') for record in records]
+    if len(frames) != len(records):
+        return None
+    return list(zip(records, frames))
+
+@accident_bp.before_app_request
+def start_uploads():
+    upload_pool.start()
+
 # Create route
 @accident_bp.route('/create', methods=['POST'])
 def create_accident():
-    accident_data = request.get_json()
-    frame_base64 = accident_data.get('frame', '')
-    frame_bytes = base64.b64decode(frame_base64)
+    accidents = read_accidents()
+    if not accidents:
+        return jsonify({
+            "status": "error",
+            "message": "Expected accident data and one frame."
+        }), 400
+    accident_data, frame = accidents[0]
 
+    document = accident_document(accident_data)
+    accident = accidents_collection.insert_one(document)
+    invalidate_accident()
     try:
-        cloudinary_response = cloudinary.uploader.upload(frame_bytes, folder="accident_frames")
-        image_url = cloudinary_response['url']
+        queue_upload(accident.inserted_id, frame)
     except Exception as e:
+        accidents_collection.delete_one({"_id": accident.inserted_id})
         return jsonify({
             "status": 'error',
-            "message": f"Failed to upload image to Cloudinary: {str(e)}"
+            "message": f"Failed to queue the image upload: {str(e)}"
         }), 500
+    # only counted once the record is there to stay
+    update_rollups([document])
 
-    accidents_collection.insert_one({
-        "address": accident_data['address'],
-        "city": accident_data['city'],
-        "latitude": accident_data['latitude'],
-        "longitude": accident_data['longitude'],
-        "severityInPercentage": accident_data['severityInPercentage'],
-        "severity": accident_data['severity'],
-        "date": datetime.now(),
-        "image_url": image_url
-    })
     return jsonify({
         "status": "success",
         "message": "Accident data saved successfully.",
-        "image_url": image_url
+        "id": str(accident.inserted_id),
+        "image_url": None,
+        "image_status": PENDING
     }), 201
 
+# Batch create route, used by the detector when several accidents arrive together
+@accident_bp.route('/create/batch', methods=['POST'])
+def create_accidents():
+    accidents = read_accidents('accidents')
+    if not accidents:
+        return jsonify({
+            "status": "error",
+            "message": "Expected a non-empty 'accidents' list with one frame per accident."
+        }), 400
+
+    results = []
+    documents = []
+    frames = []
+    for accident_data, frame in accidents:
+        try:
+            documents.append(accident_document(accident_data))
+            frames.append(frame)
+            results.append({"status": "success"})
+        except Exception as e:
+            results.append({"status": "error", "message": str(e)})
+
+    if not documents:
+        # nothing valid to store, the client has to fix the payload rather than retry it
+        return jsonify({
+            "status": "error",
+            "message": "None of the accidents are valid.",
+            "results": results
+        }), 400
+
+    # one round trip for the whole batch, the images follow in the background
+    inserted = accidents_collection.insert_many(documents)
+    invalidate_accident()
+    saved = []
+    stored = iter(zip(inserted.inserted_ids, documents, frames))
+    for result in results:
+        if result["status"] != "success":
+            continue
+        accidentId, document, frame = next(stored)
+        try:
+            queue_upload(accidentId, frame)
+        except Exception as e:
+            accidents_collection.delete_one({"_id": accidentId})
+            result.update({"status": "error", "message": f"Failed to queue the image upload: {str(e)}"})
+            continue
+        saved.append(document)
+        result.update({"id": str(accidentId), "image_status": PENDING})
+    update_rollups(saved)
+    return jsonify({
+        "status": "success" if len(saved) == len(accidents) else "partial" if saved else "error",
+        "message": f"Saved {len(saved)} of {len(accidents)} accidents.",
+        "results": results
+    }), 201 if saved else 500
+
+# Fields a client can ask for with ?fields=, id is always returned
+ACCIDENT_FIELDS = ("address", "city", "latitude", "longitude", "severityInPercentage", "severity", "date", "image_url", "image_status")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+@on_connect
+def ensure_indexes():
+    # newest first listing, optionally narrowed to a city or a severity label
+    try:
+        accidents_collection.create_index([("date", -1), ("_id", -1)])
+        accidents_collection.create_index([("city", 1), ("date", -1), ("_id", -1)])
+        accidents_collection.create_index([("severity", 1), ("date", -1), ("_id", -1)])
+    except Exception as e:
+        print(f"Could not create accident indexes: {e}")
+    ensure_geo_index(accidents_collection)
+
+def update_rollups(documents):
+    # the statistics are secondary, a failed rollup update never fails the create
+    try:
+        record_accidents(rollups_collection, documents)
+    except Exception as e:
+        print(f"Could not update accident rollups: {e}")
+
+def serialize_accident(data, fields=ACCIDENT_FIELDS):
+    accident = {"id": str(data['_id'])}
+    for field in fields:
+        value = data.get(field)
+        if field == 'date' and isinstance(value, datetime):
+            value = value.strftime('%Y-%m-%d %H:%M:%S')
+        elif field == 'image_status' and value is None:
+            value = READY
+        accident[field] = value
+    return accident
+
+def requested_fields(args):
+    # ?fields=a,b,c, id always comes along
+    fields = args['fields'].split(',') if args.get('fields') else ACCIDENT_FIELDS
+    unknown = [field for field in fields if field not in ACCIDENT_FIELDS and field != 'id']
+    if unknown:
+        raise ValueError(f"unknown fields {', '.join(unknown)}")
+    return [field for field in fields if field != 'id']
+
+def encode_cursor(data):
+    # older records keep their date as a string, or have none
+    date = data.get('date')
+    if isinstance(date, datetime):
+        key = date.isoformat()
+    elif isinstance(date, str):
+        key = f"s:{date}"
+    else:
+        key = "n:"
+    return f"{key}_{data['_id']}"
+
+def cursor_filter(cursor):
+    """
+    Filter for the records after `cursor` in newest first order. Mongo only compares a
+    date with dates and a string with strings, and sorts real dates first, then string
+    dates, then records without one, so a page ending in one kind carries on into the next.
+    """
+    key, _, accidentId = cursor.rpartition('_')
+    accidentId = ObjectId(accidentId)
+    undated = {"$nor": [{"date": {"$type": "date"}}, {"date": {"$type": "string"}}]}
+    if key == "n:":
+        return {"$and": [undated, {"_id": {"$lt": accidentId}}]}
+    if key.startswith("s:"):
+        date, later = key[2:], undated
+    else:
+        date, later = datetime.fromisoformat(key), {"date": {"$not": {"$type": "date"}}}
+    return {"$or": [{"date": {"$lt": date}}, {"date": date, "_id": {"$lt": accidentId}}, later]}
+
+def accident_filters(args):
+    """
+    Builds the Mongo filter for ?city=&severity=&minSeverity=&maxSeverity=&from=&to=,
+    severity takes a comma separated list of labels and from/to ISO dates.
+    """
+    query = {}
+    if args.get('city'):
+        query['city'] = args['city']
+    if args.get('severity'):
+        query['severity'] = {"$in": args['severity'].split(',')}
+    severityRange = {}
+    if args.get('minSeverity'):
+        severityRange['$gte'] = float(args['minSeverity'])
+    if args.get('maxSeverity'):
+        severityRange['$lte'] = float(args['maxSeverity'])
+    if severityRange:
+        query['severityInPercentage'] = severityRange
+    dateRange = {}
+    if args.get('from'):
+        dateRange['$gte'] = datetime.fromisoformat(args['from'])
+    if args.get('to'):
+        dateRange['$lt'] = datetime.fromisoformat(args['to'])
+    if dateRange:
+        query['date'] = dateRange
+    return query
+
+def list_key():
+    # same filters in any order share an entry
+    return f"{request.path}?{urlencode(sorted(request.args.items(multi=True)))}"
+
 # List Route
 @accident_bp.route('/all', methods=['GET'])
 def get_all_accidents():
-    allDatas = accidents_collection.find()
+    """
+    Newest accidents first, one page at a time. Pass the returned nextCursor as ?cursor=
+    to get the following page, it is null on the last one. ?limit= sets the page size
+    and ?fields= a comma separated subset of ACCIDENT_FIELDS.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        fields = requested_fields(request.args)
+        query = accident_filters(request.args)
+        if request.args.get('cursor'):
+            after = cursor_filter(request.args['cursor'])
+            query = {"$and": [query, after]} if query else after
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid query: {e}"
+        }), 400
+
+    def build():
+        projection = dict.fromkeys(set(fields) | {"date"}, 1)
+        # one extra row tells whether there is a next page
+        page = list(accidents_collection.find(query, projection).sort([("date", -1), ("_id", -1)]).limit(limit + 1))
+        nextCursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return {
+            "status": "success",
+            "datas": [serialize_accident(data, fields) for data in page[:limit]],
+            "nextCursor": nextCursor
+        }, 200, True
+    return cached_json("list", list_key(), build)
+
+MAX_GEO_RESULTS = 2000
+
+# Within Route, for the map: ?lat=&lng=&radius=<meters> or ?bbox=minLng,minLat,maxLng,maxLat
+@accident_bp.route('/within', methods=['GET'])
+def get_accidents_within():
+    try:
+        limit = min(max(int(request.args.get('limit', MAX_GEO_RESULTS)), 1), MAX_GEO_RESULTS)
+        fields = requested_fields(request.args)
+        query = accident_filters(request.args)
+        if request.args.get('bbox'):
+            bbox = request.args['bbox'].split(',')
+            if len(bbox) != 4:
+                raise ValueError("bbox takes minLng,minLat,maxLng,maxLat")
+            query['location'] = within_bbox(*bbox)
+        else:
+            query['location'] = within_radius(request.args['lat'], request.args['lng'], request.args['radius'])
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid query: {e}"
+        }), 400
+
+    def build():
+        found = accidents_collection.find(query, dict.fromkeys(fields, 1)).sort([("date", -1), ("_id", -1)]).limit(limit + 1)
+        try:
+            datas = [serialize_accident(data, fields) for data in found]
+        except OperationFailure as e:
+            # a shape Mongo cannot use, e.g. a polygon it considers invalid
+            return {"status": "error", "message": f"Invalid area: {e}"}, 400, False
+        return {
+            "status": "success",
+            "datas": datas[:limit],
+            # more matches than limit, the client should zoom in or narrow the filters
+            "truncated": len(datas) > limit
+        }, 200, True
+    return cached_json("list", list_key(), build)
+
+# Nearest Route: the k accidents closest to ?lat=&lng=, optionally within ?maxDistance=<meters>
+@accident_bp.route('/nearest', methods=['GET'])
+def get_nearest_accidents():
+    try:
+        k = min(max(int(request.args.get('k', 10)), 1), MAX_PAGE_SIZE)
+        fields = requested_fields(request.args)
+        near = point(request.args['lat'], request.args['lng'])
+        if near is None:
+            raise ValueError("lat/lng out of range")
+        geoNear = {"near": near, "distanceField": "distance", "spherical": True, "query": accident_filters(request.args)}
+        if request.args.get('maxDistance'):
+            geoNear["maxDistance"] = distance(request.args['maxDistance'], "maxDistance")
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid query: {e}"
+        }), 400
+
+    pipeline = [{"$geoNear": geoNear}, {"$limit": k}, {"$project": dict.fromkeys(list(fields) + ["distance"], 1)}]
+    try:
+        datas = [dict(serialize_accident(data, fields), distance=data["distance"]) for data in accidents_collection.aggregate(pipeline)]
+    except OperationFailure as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid query: {e}"
+        }), 400
     return jsonify({
         "status": "success",
-        "datas": [
-            {
-                "id": str(data['_id']),
-                "address": data['address'],
-                "city": data['city'],
-                "latitude": data['latitude'],
-                "longitude": data['longitude'],
-                "severityInPercentage": data['severityInPercentage'],
-                "severity": data['severity'],
-                "date": data['date'].strftime('%Y-%m-%d %H:%M:%S') if isinstance(data['date'], datetime) else data['date'],
-                "image_url": data['image_url']
-            } for data in allDatas
-        ]
+        "datas": datas
     })
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+def export_rows(cursor, fields, export_format):
+    """
+    Yields the accidents of `cursor` as NDJSON or CSV text in chunks of about EXPORT_CHUNK_BYTES.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == 'csv' else None
+    if writer:
+        writer.writerow(["id"] + list(fields))
+    for data in cursor:
+        accident = serialize_accident(data, fields)
+        if writer:
+            writer.writerow(accident.values())
+        else:
+            buffer.write(json.dumps(accident))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Export Route
+@accident_bp.route('/export', methods=['GET'])
+def export_accidents():
+    """
+    Streams every matching accident, oldest first, as ?format=ndjson (default) or csv.
+    Takes the same filters and ?fields= as /all, and ?gzip=1 for a gzipped download.
+    Rows are read from Mongo in batches and written out as they come, so memory
+    does not grow with the size of the export.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    try:
+        if export_format not in ('ndjson', 'csv'):
+            raise ValueError(f"unknown format {export_format}")
+        fields = requested_fields(request.args)
+        query = accident_filters(request.args)
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid query: {e}"
+        }), 400
+
+    cursor = accidents_collection.find(query, dict.fromkeys(fields, 1)).sort([("date", 1), ("_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    chunks = export_rows(cursor, fields, export_format)
+    filename = f"accidents.{export_format}"
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    if request.args.get('gzip') in ('1', 'true'):
+        chunks, filename, mimetype = gzip_chunks(chunks), filename + '.gz', 'application/gzip'
+    return Response(chunks, mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
 # Individual Accident Route
 @accident_bp.route('/<accidentId>', methods=['GET'])
 def get_single_accident(accidentId):
-    accident_id = ObjectId(accidentId)
-    accident = accidents_collection.find_one({"_id": accident_id})
-    if accident:
-        return jsonify({
+    def build():
+        accident = accidents_collection.find_one({"_id": ObjectId(accidentId)})
+        if not accident:
+            return {
+                "status": "error",
+                "message": "Accident not found"
+            }, 404, False
+        # records only change once, when their image upload finishes, until then they are not cached
+        return {
             "status": "success",
-            "data": {
-                "id": str(accident['_id']),
-                "address": accident['address'],
-                "city": accident['city'],
-                "latitude": accident['latitude'],
-                "longitude": accident['longitude'],
-                "severityInPercentage": accident['severityInPercentage'],
-                "severity": accident['severity'],
-                "date": accident['date'].strftime('%Y-%m-%d %H:%M:%S') if isinstance(accident['date'], datetime) else accident['date'],
-                "image_url": accident['image_url']
-            }
-        })
-    else:
-        return jsonify({
-            "status": "error",
-            "message": "Accident not found"
-        }), 404
+            "data": serialize_accident(accident)
+        }, 200, accident.get('image_status') != PENDING
+    return cached_json("accident", accidentId, build)
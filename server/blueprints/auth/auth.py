@@ -1,18 +1,15 @@
 import hashlib
-import os
 from flask import Blueprint, jsonify, request
 from flask_cors import cross_origin
 from flask_jwt_extended import create_access_token
-from pymongo import MongoClient
 from dotenv import load_dotenv
+from services.db import collection
 
 # Load environment variables
 load_dotenv()
 
 # MongoDB setup
-client = MongoClient(os.getenv('MONGO_URI'))
-mongo_db = client['accidentDb']
-users_collection = mongo_db['users']
+users_collection = collection('users')
 
 # Blueprint setup
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/v1/auth')
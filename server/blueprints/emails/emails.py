@@ -1,28 +1,91 @@
 from flask import  Blueprint, current_app, jsonify, request
-from flask_mail import Mail, Message
+from flask_mail import Mail
+import atexit
 import os
 from dotenv import load_dotenv
+from services.alerts import AlertDispatcher, build_senders
+from services.db import collection, on_connect
+from services.incidents import INCIDENT_COLLECTION, IncidentCoalescer
 load_dotenv()
 
 mail = Mail()
 emails = Blueprint('emails',__name__, url_prefix='/api/v1/emails')
 
+# Alert mail goes out from background threads, failures end up in alert_dead_letters
+alert_dispatcher = AlertDispatcher(
+    build_senders(mail),
+    deadLetters=collection('alert_dead_letters'),
+    workers=int(os.getenv('ALERT_WORKERS', '4')),
+    maxQueue=int(os.getenv('ALERT_QUEUE_SIZE', '1000')),
+)
+atexit.register(alert_dispatcher.join)
+
+# Alerts about the same place and time become one incident with one digest mail per recipient
+incidents = IncidentCoalescer(
+    collection(INCIDENT_COLLECTION),
+    alert_dispatcher,
+    cellMeters=float(os.getenv('INCIDENT_CELL_METERS', '200')),
+    windowSeconds=float(os.getenv('INCIDENT_WINDOW_SECONDS', '600')),
+    digestDelay=float(os.getenv('INCIDENT_DIGEST_DELAY_SECONDS', '30')),
+)
+on_connect(incidents.ensure_indexes)
+
+def report_alert(source, channel, message, latitude, longitude, severity=None, details=None):
+    """
+    Files the alert under its incident. The recipient gets `message` at once if it is the
+    first alert of the incident, and the incident digest for the ones after it. Returns
+    the incident id, or None when `message` had to be sent on its own.
+    """
+    try:
+        return incidents.record(source, latitude, longitude, severity, recipient=(channel, message["to"][0]), details=details, message=message)
+    except Exception as e:
+        # no incident store, better one mail per alert than none
+        print(f"Could not coalesce the alert, sending it directly: {e}")
+        if not alert_dispatcher.submit(channel, message):
+            raise
+        return None
+
+@emails.record_once
+def init_mail(state):
+    state.app.config.setdefault('MAIL_SERVER', os.getenv('MAIL_SERVER', 'smtp.gmail.com'))
+    state.app.config.setdefault('MAIL_PORT', int(os.getenv('MAIL_PORT', '587')))
+    state.app.config.setdefault('MAIL_USE_TLS', os.getenv('MAIL_USE_TLS', 'true') == 'true')
+    state.app.config.setdefault('MAIL_USERNAME', os.getenv('MAIL_USERNAME', os.getenv('EMAIL')))
+    state.app.config.setdefault('MAIL_PASSWORD', os.getenv('MAIL_PASSWORD'))
+    mail.init_app(state.app)
+
+@emails.before_app_request
+def start_alerts():
+    alert_dispatcher.start(current_app._get_current_object())
+    # due digests are sent even if no new alert reaches this process
+    incidents.start()
+
 @emails.route('/send-email', methods=['POST'])
 def send_email():
     latitude = request.json.get('latitude')
     longitude = request.json.get('longitude')
     severity = request.json.get('severity')
     location = request.json.get('location')
-    msg = Message(subject="🚨 Accident Alert - Severity({})".format(severity), sender=os.getenv('EMAIL'), recipients=[os.getenv('SENDTO')])
 
     googleMapLink = 'https://www.google.com/maps/search/?api=1&query={},{}'.format(latitude, longitude)
-    msg.body = "🚨 Accident Alert - Severity({})\nLocation:{}\nGoogle Map: {}".format(severity, location, googleMapLink)
-    mail.send(msg)
-    msg.body = "Hey Hash, sending you this email from my Flask app, lmk if it works"
-    mail.send(msg)
+    message = {
+        "to": [os.getenv('SENDTO')],
+        "subject": "🚨 Accident Alert - Severity({})".format(severity),
+        "text": "🚨 Accident Alert - Severity({})\nLocation:{}\nGoogle Map: {}".format(severity, location, googleMapLink),
+    }
+    try:
+        # the detector sends the confidence in percent
+        severityValue = float(severity)
+    except (TypeError, ValueError):
+        severityValue = None
+    try:
+        incidentId = report_alert("camera", "smtp", message, latitude, longitude, severityValue, {"address": location})
+    except Exception:
+        # the detector retries on 503
+        return jsonify({
+            "message": "Alert queue is full, try again later."
+        }), 503
     return jsonify({
-        "message": "Email sent successfully."
-    })
-
-if __name__ == '__main__':
-    mail.init_app(current_app)
\ No newline at end of file
+        "message": "Email queued.",
+        "incidentId": incidentId
+    }), 202
@@ -0,0 +1,66 @@
+from flask import Blueprint, jsonify, request
+from datetime import datetime
+from dotenv import load_dotenv
+from services.db import collection
+from services.rollups import ROLLUP_COLLECTION
+load_dotenv()
+
+# Blueprint setup
+stats_bp = Blueprint('stats', __name__, url_prefix='/api/v1/stats')
+
+# MongoDB setup
+rollups_collection = collection(ROLLUP_COLLECTION)
+
+def rollup_match(args):
+    """
+    Filter on the rollups for ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive) and ?city=.
+    """
+    match = {}
+    days = {}
+    if args.get('from'):
+        days['$gte'] = datetime.fromisoformat(args['from']).strftime('%Y-%m-%d')
+    if args.get('to'):
+        days['$lte'] = datetime.fromisoformat(args['to']).strftime('%Y-%m-%d')
+    if days:
+        match['_id.day'] = days
+    if args.get('city'):
+        match['_id.city'] = args['city']
+    return match
+
+def counts_by(group, match, sort):
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": group, "count": {"$sum": "$count"}}},
+        {"$sort": sort},
+    ]
+    return [{"key": row["_id"], "count": row["count"]} for row in rollups_collection.aggregate(pipeline)]
+
+def stats_response(group, sort):
+    try:
+        match = rollup_match(request.args)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid query: {e}"
+        }), 400
+    return jsonify({
+        "status": "success",
+        "datas": counts_by(group, match, sort)
+    })
+
+# Accidents per day, or per month with ?interval=month
+@stats_bp.route('/by-day', methods=['GET'])
+def get_counts_by_day():
+    if request.args.get('interval', 'day') == 'month':
+        return stats_response({"$substr": ["$_id.day", 0, 7]}, {"_id": 1})
+    return stats_response("$_id.day", {"_id": 1})
+
+# Accidents per city, most affected first
+@stats_bp.route('/by-city', methods=['GET'])
+def get_counts_by_city():
+    return stats_response("$_id.city", {"count": -1, "_id": 1})
+
+# Accidents per severity bucket (0, 10, ... 90 percent)
+@stats_bp.route('/by-severity', methods=['GET'])
+def get_counts_by_severity():
+    return stats_response("$_id.bucket", {"_id": 1})
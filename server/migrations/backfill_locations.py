@@ -0,0 +1,58 @@
+"""
+Adds the GeoJSON `location` point to accidents and mobile alerts stored before it
+existed, and creates the 2dsphere indexes. Safe to run more than once.
+
+    python migrations/backfill_locations.py [--batch_size 1000] [--dry_run]
+"""
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.geo import ensure_geo_index, point  # noqa: E402
+
+load_dotenv()
+
+# collection -> (latitude field, longitude field)
+COLLECTIONS = {
+    "accidents": ("latitude", "longitude"),
+    "mobile_alerts": ("lat", "lng"),
+}
+
+
+def backfill(collection, latField, lngField, batchSize=1000, dryRun=False):
+    updated, skipped = 0, 0
+    operations = []
+    cursor = collection.find({"location": {"$exists": False}}, {latField: 1, lngField: 1}).batch_size(batchSize)
+    for doc in cursor:
+        location = point(doc.get(latField), doc.get(lngField))
+        if location is None:
+            skipped += 1
+            continue
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"location": location}}))
+        if len(operations) >= batchSize:
+            updated += len(operations) if dryRun else collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += len(operations) if dryRun else collection.bulk_write(operations, ordered=False).modified_count
+    return updated, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill GeoJSON locations")
+    parser.add_argument("--batch_size", type=int, default=1000)
+    parser.add_argument("--dry_run", action="store_true")
+    args = parser.parse_args()
+
+    mongo_db = MongoClient(os.getenv("MONGO_URI"))["accidentDb"]
+    for name, (latField, lngField) in COLLECTIONS.items():
+        updated, skipped = backfill(mongo_db[name], latField, lngField, args.batch_size, args.dry_run)
+        print(f"{name}: {'would update' if args.dry_run else 'updated'} {updated}, skipped {skipped} without valid coordinates")
+        if not args.dry_run:
+            ensure_geo_index(mongo_db[name])
+
+
+if __name__ == "__main__":
+    main()
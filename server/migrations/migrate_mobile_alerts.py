@@ -0,0 +1,61 @@
+"""
+Copies the SOS alerts of the old mobile_alerts collection into the mobile_events
+time-series collection, which /api/mobile/sos and /api/mobile/events/bulk write to now.
+The old collection is left as it is, drop it once the copy is checked.
+
+    python migrations/migrate_mobile_alerts.py [--batch_size 1000] [--dry_run]
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.geo import point  # noqa: E402
+from services.telemetry import MOBILE_EVENT_COLLECTION, ensure_timeseries, insert_events  # noqa: E402
+
+load_dotenv()
+
+
+def event_from_alert(alert):
+    timestamp = alert.get("timestamp")
+    if isinstance(timestamp, str):
+        # stored as an ISO string before
+        timestamp = datetime.fromisoformat(timestamp)
+    return {
+        "userId": str(alert.get("userId")),
+        "type": "sos",
+        "lat": alert.get("lat"),
+        "lng": alert.get("lng"),
+        "speedKmph": alert.get("speedKmph"),
+        "accelG": alert.get("accelG"),
+        "location": alert.get("location") or point(alert.get("lat"), alert.get("lng")),
+        "timestamp": timestamp or alert["_id"].generation_time.replace(tzinfo=None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy mobile_alerts into the mobile_events time-series collection')
+    parser.add_argument('--batch_size', type=int, default=1000)
+    parser.add_argument('--dry_run', action='store_true')
+    args = parser.parse_args()
+
+    mongo_db = MongoClient(os.getenv("MONGO_URI"))["accidentDb"]
+    ensure_timeseries(mongo_db, float(os.getenv("MOBILE_EVENT_TTL_DAYS", "90")) * 86400)
+    copied = failed = 0
+    batch = []
+    for alert in mongo_db["mobile_alerts"].find({}).batch_size(args.batch_size):
+        batch.append(event_from_alert(alert))
+        if len(batch) == args.batch_size:
+            errors = [] if args.dry_run else insert_events(mongo_db[MOBILE_EVENT_COLLECTION], batch, list(range(len(batch))))
+            copied, failed, batch = copied + len(batch) - len(errors), failed + len(errors), []
+    if batch:
+        errors = [] if args.dry_run else insert_events(mongo_db[MOBILE_EVENT_COLLECTION], batch, list(range(len(batch))))
+        copied, failed = copied + len(batch) - len(errors), failed + len(errors)
+    print(f"{'Would copy' if args.dry_run else 'Copied'} {copied} mobile alerts, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
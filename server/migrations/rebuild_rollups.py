@@ -0,0 +1,25 @@
+"""
+Recomputes the accident_rollups collection behind /api/v1/stats from the accidents.
+Needed once for accidents stored before the rollups existed, safe to run again.
+
+    python migrations/rebuild_rollups.py
+"""
+import os
+import sys
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.rollups import ROLLUP_COLLECTION, rebuild  # noqa: E402
+
+load_dotenv()
+
+
+def main():
+    mongo_db = MongoClient(os.getenv("MONGO_URI"))["accidentDb"]
+    rebuild(mongo_db["accidents"], mongo_db[ROLLUP_COLLECTION])
+    print(f"Rebuilt {mongo_db[ROLLUP_COLLECTION].count_documents({})} rollup buckets from {mongo_db['accidents'].count_documents({})} accidents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+
+BREVO_URL = "https://api.brevo.com/v3/smtp/email"
+
+
+class BrevoSender(object):
+    """
+    Sends mail through the Brevo HTTP API over one pooled, kept-alive session.
+    """
+
+    def __init__(self, apiKey=None, senderEmail=None, timeout=10.0, poolSize=8):
+        self.apiKey = apiKey
+        self.senderEmail = senderEmail
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=poolSize))
+
+    def __call__(self, message):
+        response = self.session.post(BREVO_URL, timeout=self.timeout, headers={
+            "accept": "application/json",
+            "api-key": self.apiKey or os.getenv("BREVO_API_KEY"),
+        }, json={
+            "sender": {"name": "AccidentApp Alerts", "email": self.senderEmail or os.getenv("SENDER_EMAIL")},
+            "to": [{"email": to} for to in message["to"]],
+            "subject": message["subject"],
+            "htmlContent": message.get("html") or message.get("text"),
+        })
+        response.raise_for_status()
+        return response.status_code
+
+
+class SmtpSender(object):
+    """
+    Sends mail over SMTP with Flask-Mail, needs the app context the dispatcher pushes.
+    """
+
+    def __init__(self, mail):
+        self.mail = mail
+
+    def __call__(self, message):
+        from flask_mail import Message
+        self.mail.send(Message(
+            subject=message["subject"],
+            sender=message.get("sender") or os.getenv('EMAIL'),
+            recipients=message["to"],
+            body=message.get("text"),
+            html=message.get("html"),
+        ))
+
+
+class FakeMailSink(object):
+    """
+    Stand-in for the mail providers in development and tests: keeps the last messages in
+    memory and appends them to a JSON lines file, after `delay` seconds of simulated latency.
+    """
+
+    def __init__(self, path="instance/fake_mail.jsonl", delay=0.0):
+        self.path = path
+        self.delay = delay
+        self.messages = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def __call__(self, message):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.messages.append(message)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(message) + "\n")
+
+
+def build_senders(mail):
+    # ALERT_MAIL_SINK=fake sends nothing and records the messages, ALERT_FAKE_DELAY_MS simulates a slow provider
+    if os.getenv('ALERT_MAIL_SINK') == 'fake':
+        sink = FakeMailSink(
+            path=os.getenv('ALERT_FAKE_MAIL_PATH', 'instance/fake_mail.jsonl'),
+            delay=float(os.getenv('ALERT_FAKE_DELAY_MS', '0')) / 1000.0,
+        )
+        return {"brevo": sink, "smtp": sink}
+    return {"brevo": BrevoSender(), "smtp": SmtpSender(mail)}
+
+
+def _retryable(error):
+    # provider rejected the message itself, sending it again will not help
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status is None or status == 429 or status >= 500
+
+
+class AlertDispatcher(object):
+    """
+    Sends alert mail from background threads so the endpoints answer right away.
+
+    submit() puts the message on a bounded queue and returns, a pool of `workers`
+    threads hands it to the sender of its channel ("brevo", "smtp"), retrying with
+    exponential backoff. Messages that still fail, or that find the queue full, are
+    written to the `deadLetters` collection with the error. Queue wait and delivery
+    time are kept for stats(). Messages still queued at exit get `shutdownTimeout`
+    seconds to go out.
+    """
+
+    def __init__(self, senders, deadLetters=None, workers=4, maxQueue=1000, retries=3, backoff=1.0, shutdownTimeout=10.0):
+        self.senders = senders
+        self.deadLetters = deadLetters
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.shutdownTimeout = shutdownTimeout
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=1000)
+        self._queue = queue.Queue(maxsize=maxQueue)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._app = None
+
+    def start(self, app=None):
+        """
+        Starts the sender threads of this process, cheap to call again. With `app`,
+        every send runs inside its app context.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._app = app
+            for _ in range(self.workers):
+                threading.Thread(target=self._run, name="alert-dispatch", daemon=True).start()
+
+    def submit(self, channel, message):
+        """
+        Queues `message` ({to: [...], subject, html and/or text}) for `channel`. Returns
+        False when the queue is full, the message then goes to the dead letters.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((channel, message, time.time()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self._dead_letter(channel, message, "alert queue full", 0)
+            return False
+
+    def _run(self):
+        while True:
+            channel, message, queuedAt = self._queue.get()
+            try:
+                if self._app is not None:
+                    with self._app.app_context():
+                        self._deliver(channel, message, queuedAt)
+                else:
+                    self._deliver(channel, message, queuedAt)
+            except Exception as e:
+                print(f"Alert dispatch worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, channel, message, queuedAt):
+        for attempt in range(self.retries + 1):
+            try:
+                self.senders[channel](message)
+                break
+            except Exception as e:
+                if attempt == self.retries or not _retryable(e):
+                    print(f"Failed to send {channel} alert '{message.get('subject')}': {e}")
+                    self.failed += 1
+                    self._dead_letter(channel, message, str(e), attempt + 1)
+                    return
+                self.retried += 1
+                time.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+        self.sent += 1
+        self.latencies.append(time.time() - queuedAt)
+
+    def _dead_letter(self, channel, message, error, attempts):
+        if self.deadLetters is None:
+            return
+        try:
+            self.deadLetters.insert_one({
+                "channel": channel,
+                "message": message,
+                "error": error,
+                "attempts": attempts,
+                "failedAt": datetime.utcnow(),
+            })
+        except Exception as e:
+            print(f"Could not store the dead letter for '{message.get('subject')}': {e}")
+
+    def join(self, timeout=None):
+        """
+        Waits up to `timeout` seconds [shutdownTimeout] for the queue to empty, returns what is left.
+        """
+        deadline = time.time() + (self.shutdownTimeout if timeout is None else timeout)
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+        return self._queue.unfinished_tasks
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        percentile = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1) if latencies else 0.0
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "latencyMsP50": percentile(0.5),
+            "latencyMsP99": percentile(0.99),
+            "latencyMsMax": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        }
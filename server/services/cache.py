@@ -0,0 +1,185 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend(object):
+    """
+    In-process LRU store with a TTL per entry, holds at most `maxEntries` entries.
+    """
+
+    def __init__(self, maxEntries=1024):
+        self.maxEntries = maxEntries
+        self._entries = OrderedDict()
+        # counters (namespace versions) are kept apart so they are never evicted
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend(object):
+    """
+    Store shared by every server process, so a create seen by one worker invalidates all of them.
+    """
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(key, pickle.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+    def counter(self, key):
+        # INCR keeps counters as plain integers, they are never pickled
+        value = self.client.get(key)
+        return int(value) if value is not None else 0
+
+    def size(self):
+        return self.client.dbsize()
+
+
+class ResponseCache(object):
+    """
+    Read-through cache of JSON response bodies with their ETag.
+
+    Entries live in a namespace ("accident", "list"). invalidate(namespace, key) drops
+    one entry, invalidate(namespace) drops the whole namespace at once by bumping its
+    version, which is part of every key. `namespaceTtls` overrides `ttl` for some
+    namespaces. Lookups and invalidations are counted for stats().
+    """
+
+    def __init__(self, backend, ttl=300.0, prefix="accidentapp:", namespaceTtls=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.namespaceTtls = namespaceTtls or {}
+        self.hits = 0
+        self.misses = 0
+        self.notModified = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _version(self, namespace):
+        return self.backend.counter(f"{self.prefix}{namespace}:version")
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}{namespace}:{self._version(namespace)}:{key}"
+
+    def get(self, namespace, key):
+        """
+        Returns the cached (body, etag) or None.
+        """
+        try:
+            entry = self.backend.get(self._key(namespace, key))
+        except Exception as e:
+            # a cache that is down only costs the database lookup
+            self.errors += 1
+            print(f"Cache lookup failed: {e}")
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def set(self, namespace, key, body, ttl=None):
+        etag = hashlib.sha1(body).hexdigest()
+        ttl = self.namespaceTtls.get(namespace, self.ttl) if ttl is None else ttl
+        if ttl <= 0:
+            return body, etag
+        try:
+            self.backend.set(self._key(namespace, key), (body, etag), ttl)
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache store failed: {e}")
+        return body, etag
+
+    def invalidate(self, namespace, key=None):
+        try:
+            if key is None:
+                self.backend.incr(f"{self.prefix}{namespace}:version")
+            else:
+                self.backend.delete(self._key(namespace, key))
+            self.invalidations += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache invalidation failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            entries = self.backend.size()
+        except Exception:
+            entries = None
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "notModified": self.notModified,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+
+def build_cache():
+    # CACHE_BACKEND=redis (with REDIS_URL) shares the cache between workers, CACHE_TTL_SECONDS=0 turns it off
+    ttl = float(os.getenv('CACHE_TTL_SECONDS', '300'))
+    if os.getenv('CACHE_BACKEND', 'memory') == 'redis':
+        backend = RedisBackend(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+        listTtl = ttl
+    else:
+        backend = MemoryBackend(int(os.getenv('CACHE_MAX_ENTRIES', '1024')))
+        # a create only invalidates the worker that handled it, the other workers' lists
+        # (and the image status in them) catch up once their entries expire
+        listTtl = 5.0
+    listTtl = min(ttl, float(os.getenv('CACHE_LIST_TTL_SECONDS', listTtl)))
+    return ResponseCache(backend, ttl=ttl, namespaceTtls={"list": listTtl})
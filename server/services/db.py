@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import deque
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+DATABASE_NAME = "accidentDb"
+
+# env var -> MongoClient option, all optional
+CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_READ_PREFERENCE": ("readPreference", str),
+}
+DEFAULT_OPTIONS = {"maxPoolSize": 20, "serverSelectionTimeoutMS": 5000}
+
+
+def client_options():
+    options = dict(DEFAULT_OPTIONS)
+    for env, (option, cast) in CLIENT_OPTIONS.items():
+        if os.getenv(env):
+            options[option] = cast(os.getenv(env))
+    return options
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Connection pool counters for one process: connections open and checked out (now
+    and at most), checkouts, failed checkouts and how long requests waited for a connection.
+    """
+
+    def __init__(self):
+        self.open = 0
+        self.checkedOut = 0
+        self.maxCheckedOut = 0
+        self.checkouts = 0
+        self.failures = {}
+        self.waits = deque(maxlen=1000)
+        self._started = threading.local()
+        self._lock = threading.Lock()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        self._started.time = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.failures[str(event.reason)] = self.failures.get(str(event.reason), 0) + 1
+
+    def connection_checked_out(self, event):
+        started = getattr(self._started, "time", None)
+        with self._lock:
+            self.checkouts += 1
+            self.checkedOut += 1
+            self.maxCheckedOut = max(self.maxCheckedOut, self.checkedOut)
+            if started is not None:
+                self.waits.append(time.perf_counter() - started)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checkedOut -= 1
+
+    def summary(self):
+        with self._lock:
+            waits = sorted(self.waits)
+        percentile = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 3) if waits else 0.0
+        return {
+            "open": self.open,
+            "checkedOut": self.checkedOut,
+            "maxCheckedOut": self.maxCheckedOut,
+            "checkouts": self.checkouts,
+            "checkoutFailures": self.failures,
+            "waitMsP50": percentile(0.5),
+            "waitMsP99": percentile(0.99),
+            "waitMsMax": round(waits[-1] * 1000, 3) if waits else 0.0,
+        }
+
+
+_lock = threading.Lock()
+_client = None
+_pid = None
+_metrics = None
+_on_connect = []
+
+
+def get_client():
+    """
+    Returns this process's MongoClient, creating it on first use. Clients must not be
+    shared across fork, so a gunicorn worker never reuses one the preloading master made.
+    """
+    global _client, _pid, _metrics
+    if _client is not None and _pid == os.getpid():
+        return _client
+    with _lock:
+        if _client is None or _pid != os.getpid():
+            _metrics = PoolMetrics()
+            _client = MongoClient(os.getenv('MONGO_URI'), event_listeners=[_metrics], **client_options())
+            _pid = os.getpid()
+            callbacks = list(_on_connect)
+        else:
+            return _client
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print(f"Database setup step {callback.__name__} failed: {e}")
+    return _client
+
+
+def get_db():
+    return get_client()[DATABASE_NAME]
+
+
+def on_connect(callback):
+    """
+    Runs `callback` (e.g. index creation) once in every process, right after it connects.
+    """
+    _on_connect.append(callback)
+    return callback
+
+
+class LazyCollection(object):
+    """
+    Stands in for a pymongo collection at module level without connecting at import.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(get_db()[self.name], attribute)
+
+
+def collection(name):
+    return LazyCollection(name)
+
+
+def pool_stats():
+    if _metrics is None or _pid != os.getpid():
+        return {"pid": os.getpid(), "connected": False}
+    return dict(_metrics.summary(), pid=os.getpid(), connected=True, options=client_options())
@@ -0,0 +1,73 @@
+import math
+
+EARTH_RADIUS_METERS = 6378100.0
+# a box edge along a pole collapses to one point, which Mongo rejects as a polygon
+MAX_BBOX_LATITUDE = 89.999
+# polygon edges are great circles, keep them short enough to stay unambiguous
+MAX_BBOX_WIDTH = 90.0
+
+
+def point(latitude, longitude):
+    """
+    Returns the GeoJSON point stored in `location` for 2dsphere queries, or None if the
+    coordinates are missing or out of range. Note GeoJSON puts longitude first.
+    """
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or math.isnan(latitude + longitude):
+        return None
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def ensure_geo_index(collection):
+    # records without a location are simply left out of the index
+    try:
+        collection.create_index([("location", "2dsphere")])
+    except Exception as e:
+        print(f"Could not create the location index on {collection.name}: {e}")
+
+
+def distance(meters, name="radius"):
+    meters = float(meters)
+    if not 0 <= meters < math.inf:
+        raise ValueError(f"{name} must be a positive number of meters")
+    # nothing on Earth is further than half way round it
+    return min(meters, math.pi * EARTH_RADIUS_METERS)
+
+
+def within_radius(latitude, longitude, radius):
+    # radius in meters, $centerSphere wants radians
+    center = point(latitude, longitude)
+    if center is None:
+        raise ValueError("lat/lng out of range")
+    return {"$geoWithin": {"$centerSphere": [center["coordinates"], distance(radius) / EARTH_RADIUS_METERS]}}
+
+
+def within_bbox(minLng, minLat, maxLng, maxLat):
+    """
+    $geoWithin for a map's bounds. Latitudes are clamped to the poles. Longitudes may run past
+    +-180 as they do once a map is panned across the antimeridian, they are wrapped and the box is
+    split there (and into pieces of at most MAX_BBOX_WIDTH degrees).
+    """
+    minLng, minLat, maxLng, maxLat = float(minLng), float(minLat), float(maxLng), float(maxLat)
+    if not all(math.isfinite(value) for value in (minLng, minLat, maxLng, maxLat)):
+        raise ValueError("bbox must be numbers")
+    minLat, maxLat = max(minLat, -MAX_BBOX_LATITUDE), min(maxLat, MAX_BBOX_LATITUDE)
+    if minLat >= maxLat or minLng >= maxLng:
+        raise ValueError("bbox must be minLng,minLat,maxLng,maxLat with min below max")
+    width = min(maxLng - minLng, 360.0)
+    start = minLng if -180.0 <= minLng < 180.0 else (minLng + 180.0) % 360.0 - 180.0
+    polygons = []
+    while width > 0:
+        # up to the antimeridian, then carry on from -180
+        step = min(width, MAX_BBOX_WIDTH, 180.0 - start)
+        end = start + step
+        ring = [[start, minLat], [end, minLat], [end, maxLat], [start, maxLat], [start, minLat]]
+        polygons.append([ring])
+        width -= step
+        start = -180.0 if end >= 180.0 else end
+    if len(polygons) == 1:
+        return {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": polygons[0]}}}
+    return {"$geoWithin": {"$geometry": {"type": "MultiPolygon", "coordinates": polygons}}}
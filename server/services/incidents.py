@@ -0,0 +1,197 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from services.geo import point
+
+INCIDENT_COLLECTION = "incidents"
+METERS_PER_DEGREE = 111320.0
+
+
+def incident_cell(latitude, longitude, cellMeters):
+    """
+    Grid cell of about cellMeters x cellMeters holding the point, as (row, column).
+    """
+    step = cellMeters / METERS_PER_DEGREE
+    row = math.floor(float(latitude) / step)
+    # columns narrow towards the poles, measured at the row's own latitude
+    columnStep = step / max(math.cos(math.radians((row + 0.5) * step)), 0.01)
+    return row, math.floor(float(longitude) / columnStep)
+
+
+class IncidentCoalescer(object):
+    """
+    Folds alerts about the same accident into one incident and mails one digest per
+    incident per recipient.
+
+    An alert joins an incident that was active in the last `windowSeconds` in its
+    location cell (`cellMeters` wide) or one of the eight around it, so a pileup on a
+    cell border stays one incident, and every alert keeps it active for as long as they
+    keep coming. Otherwise it opens the incident of its own cell and time window, an id
+    every worker derives the same way, so concurrent first alerts still meet in one document. The incident keeps the alert count per source,
+    the highest severity and the first and last alert time. The first alert of an
+    incident is mailed to each recipient at once. Their follow-ups are collected and
+    mailed as one digest, at most every `digestDelay` seconds, so the burst of alerts a
+    pileup produces becomes one mail. Digests are sent by a sweeper thread started in
+    every process (start()), each incident is claimed atomically so only one sends it.
+    """
+
+    def __init__(self, collection, dispatcher, cellMeters=200.0, windowSeconds=600.0, digestDelay=30.0, sweepInterval=1.0):
+        self.collection = collection
+        self.dispatcher = dispatcher
+        self.cellMeters = cellMeters
+        self.windowSeconds = windowSeconds
+        self.digestDelay = digestDelay
+        self.sweepInterval = sweepInterval
+        self.alerts = 0
+        self.incidents = 0
+        self.immediate = 0
+        self.digests = 0
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_indexes(self):
+        try:
+            self.collection.create_index([("notifyAt", 1)])
+            self.collection.create_index([("cell", 1), ("lastSeenAt", -1)])
+        except Exception as e:
+            print(f"Could not create incident indexes: {e}")
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._sweep, name="incident-digest", daemon=True).start()
+
+    def incident_id(self, latitude, longitude, now):
+        """
+        Id of the active incident nearby, or of a new one for this cell and window.
+        """
+        row, column = incident_cell(latitude, longitude, self.cellMeters)
+        nearby = [f"{row + i}:{column + j}" for i in (-1, 0, 1) for j in (-1, 0, 1)]
+        # matched on the last alert, not the window it started in, so an incident that keeps
+        # getting alerts stays one incident however long it lasts
+        active = self.collection.find_one(
+            {"cell": {"$in": nearby}, "lastSeenAt": {"$gte": now - timedelta(seconds=self.windowSeconds)}},
+            {"_id": 1}, sort=[("firstSeenAt", 1)],
+        )
+        # an incident started in this cell and window is still active, so a new id is never taken
+        return active["_id"] if active else f"{row}:{column}:{int(now.timestamp() // self.windowSeconds)}"
+
+    def record(self, source, latitude, longitude, severity=None, recipient=None, details=None, message=None):
+        """
+        Adds an alert to its incident, `recipient` is (channel, address) of who should
+        hear about the incident. A recipient the incident has not alerted yet is sent
+        `message` (or the incident so far) right away, later alerts wait for the digest.
+        Returns the incident id.
+        """
+        now = datetime.utcnow()
+        incidentId = self.incident_id(latitude, longitude, now)
+        update = {
+            "$inc": {"count": 1, f"sources.{source}": 1},
+            "$set": {"lastSeenAt": now},
+            "$setOnInsert": {
+                "firstSeenAt": now,
+                "cell": "{}:{}".format(*incident_cell(latitude, longitude, self.cellMeters)),
+                "latitude": float(latitude),
+                "longitude": float(longitude),
+                "location": point(latitude, longitude),
+                "notifyAt": now + timedelta(seconds=self.digestDelay),
+                "alerted": [],
+                "notified": [],
+            },
+            "$push": {"events": {"$each": [dict(details or {}, source=source, at=now)], "$slice": -20}},
+        }
+        if severity is not None:
+            update["$max"] = {"maxSeverity": float(severity)}
+        for attempt in range(2):
+            try:
+                incident = self.collection.find_one_and_update({"_id": incidentId}, update, upsert=True, return_document=ReturnDocument.AFTER)
+                break
+            except DuplicateKeyError:
+                # two workers inserted the same incident at once, the second try updates it
+                if attempt:
+                    raise
+        self.alerts += 1
+        if incident["count"] == 1:
+            self.incidents += 1
+        if recipient is not None:
+            self.notify(incident, recipient, message)
+        return incidentId
+
+    def notify(self, incident, recipient, message=None):
+        channel, address = recipient
+        # only one alert per incident and address claims the immediate mail
+        first = self.collection.find_one_and_update(
+            {"_id": incident["_id"], "alerted": {"$ne": address}}, {"$addToSet": {"alerted": address}}
+        )
+        if first is not None and self.dispatcher.submit(channel, message or self.digest(incident, address)):
+            self.immediate += 1
+            return
+        # a follow-up, or the queue was full: the next digest covers it
+        self.collection.update_one({"_id": incident["_id"]}, {"$addToSet": {"pending": f"{channel}:{address}"}})
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.sweepInterval)
+            try:
+                self.send_due()
+            except Exception as e:
+                print(f"Incident digest sweep failed: {e}")
+
+    def send_due(self):
+        """
+        Sends the digests that are due, returns how many were queued.
+        """
+        sent = 0
+        now = datetime.utcnow()
+        due = {"pending.0": {"$exists": True}, "notifyAt": {"$lte": now}}
+        while True:
+            # claim: whatever is pending now becomes notified and the next digest waits
+            # digestDelay, the returned old state says who is due
+            incident = self.collection.find_one_and_update(due, [{"$set": {
+                "notified": {"$setUnion": ["$notified", "$pending"]},
+                "pending": [],
+                "notifyAt": now + timedelta(seconds=self.digestDelay),
+            }}])
+            if incident is None:
+                return sent
+            # one digest per address, whichever channel first asked for it
+            notified = set()
+            for recipient in incident["pending"]:
+                channel, address = recipient.split(':', 1)
+                if address in notified:
+                    continue
+                notified.add(address)
+                self.dispatcher.submit(channel, self.digest(incident, address))
+                self.digests += 1
+                sent += 1
+
+    def digest(self, incident, address):
+        mapLink = f"https://www.google.com/maps/search/?api=1&query={incident['latitude']},{incident['longitude']}"
+        sources = ", ".join(f"{count} from {source}" for source, count in sorted(incident.get("sources", {}).items()))
+        severity = incident.get("maxSeverity")
+        subject = "🚨 Accident Alert - Severity({})".format(round(severity, 1) if severity is not None else "unknown")
+        lines = [
+            subject,
+            f"Alerts: {incident['count']} ({sources})",
+            f"First alert: {incident['firstSeenAt'].strftime('%Y-%m-%d %H:%M:%S')} UTC",
+            f"Last alert: {incident['lastSeenAt'].strftime('%Y-%m-%d %H:%M:%S')} UTC",
+        ]
+        for event in incident.get("events", []):
+            details = ", ".join(f"{key}: {value}" for key, value in event.items() if key not in ("source", "at"))
+            lines.append(f"{event['at'].strftime('%H:%M:%S')} {event['source']}: {details}")
+        lines.append(f"Google Map: {mapLink}")
+        return {
+            "to": [address],
+            "subject": subject,
+            "text": "\n".join(lines),
+            "html": "<h2>" + lines[0] + "</h2>" + "".join(f"<p>{line}</p>" for line in lines[1:-1]) + f'<p><a href="{mapLink}">{mapLink}</a></p>',
+        }
+
+    def stats(self):
+        return {"alerts": self.alerts, "incidents": self.incidents, "immediate": self.immediate, "digests": self.digests}
@@ -0,0 +1,67 @@
+from collections import Counter
+from datetime import datetime
+
+# One document per (day, city, severity label, severity bucket) with the number of accidents in it,
+# so the dashboard charts cost O(buckets) instead of a scan of every accident
+ROLLUP_COLLECTION = "accident_rollups"
+BUCKET_SIZE = 10
+
+
+def severity_bucket(severityInPercentage):
+    # 0, 10, ... 90, a severity of 100% falls in the 90 bucket
+    if not isinstance(severityInPercentage, (int, float)):
+        return None
+    return int(min(max(severityInPercentage, 0), 99.999) // BUCKET_SIZE * BUCKET_SIZE)
+
+
+def rollup_key(document):
+    # the field order matters, embedded _id documents only match in the same order as rebuild() writes them
+    return {
+        "day": document["date"].strftime('%Y-%m-%d'),
+        "city": document.get("city"),
+        "severity": document.get("severity"),
+        "bucket": severity_bucket(document.get("severityInPercentage")),
+    }
+
+
+def record_accidents(rollups, documents):
+    """
+    Adds freshly inserted accident documents to the rollups, one upsert per distinct bucket.
+    """
+    counts = Counter()
+    keys = {}
+    for document in documents:
+        if not isinstance(document.get("date"), datetime):
+            continue
+        key = rollup_key(document)
+        hashable = tuple(key.values())
+        keys[hashable] = key
+        counts[hashable] += 1
+    for hashable, count in counts.items():
+        rollups.update_one({"_id": keys[hashable]}, {"$inc": {"count": count}}, upsert=True)
+
+
+def rebuild(accidents, rollups):
+    """
+    Recomputes every rollup from the accidents collection with one aggregation and atomically
+    replaces the rollup collection. Accidents inserted while it runs may be missed, run it
+    again after a backfill or if the counts ever drift.
+    """
+    severity = "$severityInPercentage"
+    accidents.aggregate([
+        {"$match": {"date": {"$type": "date"}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
+                "city": "$city",
+                "severity": "$severity",
+                "bucket": {"$cond": [
+                    {"$isNumber": severity},
+                    {"$toInt": {"$multiply": [{"$floor": {"$divide": [{"$min": [{"$max": [severity, 0]}, 99.999]}, BUCKET_SIZE]}}, BUCKET_SIZE]}},
+                    None,
+                ]},
+            },
+            "count": {"$sum": 1},
+        }},
+        {"$out": rollups.name},
+    ])
@@ -0,0 +1,149 @@
+import json
+import zlib
+from datetime import datetime, timezone
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+from services.geo import point
+
+MOBILE_EVENT_COLLECTION = "mobile_events"
+EVENT_TYPES = ("telemetry", "sos")
+NUMBER = (int, float)
+
+# field -> (accepted types, required, (min, max) or None)
+EVENT_SCHEMA = {
+    "userId": (str, True, None),
+    "lat": (NUMBER, True, (-90, 90)),
+    "lng": (NUMBER, True, (-180, 180)),
+    "speedKmph": (NUMBER, True, (0, 1000)),
+    "accelG": (NUMBER, True, (0, 100)),
+    "heading": (NUMBER, False, (0, 360)),
+    "accuracyM": (NUMBER, False, (0, 100000)),
+}
+
+
+class PayloadTooLarge(ValueError):
+    pass
+
+
+def ensure_timeseries(db, ttlSeconds):
+    """
+    Creates the time-series collection of mobile events (one series per userId) with
+    TTL retention, a no-op when it already exists.
+    """
+    try:
+        db.create_collection(
+            MOBILE_EVENT_COLLECTION,
+            timeseries={"timeField": "timestamp", "metaField": "userId", "granularity": "seconds"},
+            expireAfterSeconds=int(ttlSeconds),
+        )
+    except (CollectionInvalid, OperationFailure):
+        # already there, keep its retention in line with the setting
+        try:
+            db.command("collMod", MOBILE_EVENT_COLLECTION, expireAfterSeconds=int(ttlSeconds))
+        except OperationFailure as e:
+            print(f"Could not update the mobile event retention: {e}")
+    try:
+        db[MOBILE_EVENT_COLLECTION].create_index([("location", "2dsphere")])
+    except Exception as e:
+        print(f"Could not create the mobile event geo index: {e}")
+
+
+def parse_timestamp(value, now):
+    if value is None:
+        return now
+    if isinstance(value, NUMBER) and not isinstance(value, bool):
+        # epoch seconds, or milliseconds as phones usually send
+        return datetime.fromtimestamp(value / 1000.0 if value > 1e11 else value, timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+    raise ValueError("timestamp must be epoch seconds/milliseconds or an ISO date")
+
+
+def event_document(raw, now):
+    """
+    Validates one event against EVENT_SCHEMA and returns the document to store, raises
+    ValueError with what is wrong.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("event must be an object")
+    document = {}
+    for field, (types, required, bounds) in EVENT_SCHEMA.items():
+        value = raw.get(field)
+        if value is None:
+            if required:
+                raise ValueError(f"missing {field}")
+            continue
+        if not isinstance(value, types) or isinstance(value, bool):
+            raise ValueError(f"{field} has the wrong type")
+        if bounds and not bounds[0] <= value <= bounds[1]:
+            raise ValueError(f"{field} out of range")
+        document[field] = value
+    eventType = raw.get("type", "telemetry")
+    if eventType not in EVENT_TYPES:
+        raise ValueError(f"type must be one of {', '.join(EVENT_TYPES)}")
+    document["type"] = eventType
+    document["timestamp"] = parse_timestamp(raw.get("timestamp"), now)
+    document["location"] = point(document["lat"], document["lng"])
+    document["receivedAt"] = now
+    return document
+
+
+def read_events(body, gzipped, maxBytes):
+    """
+    Decompresses `body` if needed, refusing to inflate past maxBytes, and returns its
+    events decoded, a line that is not JSON is returned as its ValueError.
+    """
+    if gzipped:
+        decompressor = zlib.decompressobj(47)
+        body = decompressor.decompress(body, maxBytes)
+        if decompressor.unconsumed_tail:
+            raise PayloadTooLarge(f"more than {maxBytes} bytes once decompressed")
+    elif len(body) > maxBytes:
+        raise PayloadTooLarge(f"more than {maxBytes} bytes")
+    text = body.decode('utf-8')
+    if text.lstrip().startswith('['):
+        # a plain JSON array is accepted too
+        return json.loads(text)
+    events = []
+    for line in text.splitlines():
+        if line.strip():
+            try:
+                events.append(json.loads(line))
+            except ValueError as e:
+                events.append(e)
+    return events
+
+
+def parse_events(events, now):
+    """
+    Returns (documents, indexes, errors): the valid documents with their position in
+    `events`, and {"index", "error"} for every rejected event.
+    """
+    documents, indexes, errors = [], [], []
+    for index, event in enumerate(events):
+        try:
+            if isinstance(event, ValueError):
+                raise event
+            documents.append(event_document(event, now))
+            indexes.append(index)
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    return documents, indexes, errors
+
+
+def insert_events(collection, documents, indexes, chunkSize=1000):
+    """
+    Writes the documents with unordered insert_many in chunks, a failed write does not
+    stop the rest. Returns {"index", "error"} for every document that was not stored.
+    """
+    errors = []
+    for start in range(0, len(documents), chunkSize):
+        chunk = documents[start:start + chunkSize]
+        try:
+            collection.insert_many(chunk, ordered=False)
+        except BulkWriteError as e:
+            for writeError in e.details.get("writeErrors", []):
+                errors.append({"index": indexes[start + writeError["index"]], "error": writeError.get("errmsg", "write failed")})
+        except Exception as e:
+            errors.extend({"index": index, "error": str(e)} for index in indexes[start:start + chunkSize])
+    return errors
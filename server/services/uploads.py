@@ -0,0 +1,184 @@
+import glob
+import os
+import queue
+import threading
+import time
+import cloudinary.uploader
+from bson import ObjectId
+
+# image_status of an accident record
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+def cloudinary_upload(path):
+    cloudinary_response = cloudinary.uploader.upload(path, folder="accident_frames")
+    return cloudinary_response['url']
+
+
+class LocalUploader(object):
+    """
+    Stand-in for Cloudinary in development and tests: copies the frame under the
+    static folder and returns its URL, after `delay` seconds of simulated latency.
+    """
+
+    def __init__(self, directory="static/accident_frames", baseUrl="/static/accident_frames", delay=0.0):
+        self.directory = directory
+        self.baseUrl = baseUrl
+        self.delay = delay
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, path):
+        if self.delay:
+            time.sleep(self.delay)
+        name = os.path.basename(path).split('.')[0] + '.jpg'
+        with open(path, 'rb') as src, open(os.path.join(self.directory, name), 'wb') as dst:
+            dst.write(src.read())
+        return f"{self.baseUrl}/{name}"
+
+
+def build_uploader():
+    # IMAGE_UPLOADER=local keeps images on this server (in IMAGE_LOCAL_DIR), IMAGE_UPLOAD_DELAY_MS simulates a slow host
+    if os.getenv('IMAGE_UPLOADER', 'cloudinary') == 'local':
+        return LocalUploader(
+            directory=os.getenv('IMAGE_LOCAL_DIR', 'static/accident_frames'),
+            delay=float(os.getenv('IMAGE_UPLOAD_DELAY_MS', '0')) / 1000.0,
+        )
+    return cloudinary_upload
+
+
+class UploadPool(object):
+    """
+    Uploads accident frames in background threads and fills in image_url afterwards.
+
+    submit() spools the frame to disk and returns at once, so a create request only
+    pays for a local file write. A worker claims the spooled file, uploads it with
+    `uploader` (retrying with backoff) and sets image_url and image_status on the
+    record. Spooled files survive a restart and are picked up again by recover(),
+    the claim is an atomic rename so several gunicorn workers never upload the same
+    frame twice. `onUpdate`, if given, is called with the record id after its image
+    fields changed.
+    """
+
+    def __init__(self, collection, uploader=None, workers=4, spoolDir="instance/uploads", retries=3, backoff=1.0, onUpdate=None):
+        self.collection = collection
+        self.uploader = uploader or cloudinary_upload
+        self.workers = workers
+        self.spoolDir = spoolDir
+        self.retries = retries
+        self.backoff = backoff
+        self.onUpdate = onUpdate
+        self.uploaded = 0
+        self.failed = 0
+        self.lastUploadSeconds = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """
+        Starts the upload threads of this process and recovers spooled frames, cheap to call again.
+        """
+        # threads do not survive a fork, so every gunicorn worker starts its own
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            os.makedirs(self.spoolDir, exist_ok=True)
+            for _ in range(self.workers):
+                threading.Thread(target=self._run, name="image-upload", daemon=True).start()
+        self.recover()
+
+    def submit(self, accidentId, frame):
+        """
+        Queues the upload of `frame` (JPEG bytes or a readable stream) for the record `accidentId`.
+        """
+        self.start()
+        path = os.path.join(self.spoolDir, f"{accidentId}.jpg")
+        with open(path + ".tmp", 'wb') as f:
+            f.write(frame if isinstance(frame, (bytes, bytearray)) else frame.read())
+        os.replace(path + ".tmp", path)
+        self._queue.put(path)
+
+    def recover(self):
+        """
+        Queues frames left in the spool by a previous process, returns how many.
+        """
+        recovered = 0
+        for path in glob.glob(os.path.join(self.spoolDir, "*.jpg*")):
+            if path.endswith(".tmp"):
+                continue
+            owner = path.rsplit('.', 1)[-1]
+            if owner.isdigit() and _alive(int(owner)):
+                continue
+            self._queue.put(path)
+            recovered += 1
+        return recovered
+
+    def _claim(self, path):
+        claimed = os.path.join(self.spoolDir, os.path.basename(path).split('.')[0] + f".jpg.{os.getpid()}")
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            claimed = self._claim(path)
+            if claimed is None:
+                continue
+            try:
+                self._upload(claimed)
+            except Exception as e:
+                # e.g. Mongo unreachable, the frame stays spooled and is recovered after a restart
+                print(f"Image upload worker error for {claimed}: {e}")
+
+    def _upload(self, path):
+        accidentId = ObjectId(os.path.basename(path).split('.')[0])
+        startTime = time.time()
+        for attempt in range(self.retries + 1):
+            try:
+                image_url = self.uploader(path)
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"Failed to upload image for accident {accidentId}: {e}")
+                    self.collection.update_one({"_id": accidentId}, {"$set": {"image_status": FAILED, "image_error": str(e)}})
+                    self.failed += 1
+                    os.remove(path)
+                    self._updated(accidentId)
+                    return
+                time.sleep(self.backoff * 2 ** attempt)
+        self.collection.update_one({"_id": accidentId}, {"$set": {"image_url": image_url, "image_status": READY}})
+        os.remove(path)
+        self.uploaded += 1
+        self.lastUploadSeconds = time.time() - startTime
+        self._updated(accidentId)
+
+    def _updated(self, accidentId):
+        if self.onUpdate is not None:
+            try:
+                self.onUpdate(accidentId)
+            except Exception as e:
+                print(f"Image upload callback failed for {accidentId}: {e}")
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "uploaded": self.uploaded,
+            "failed": self.failed,
+            "lastUploadSeconds": self.lastUploadSeconds,
+        }
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
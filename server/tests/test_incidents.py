@@ -0,0 +1,61 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import mongomock
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+from services import incidents  # noqa: E402
+
+
+class Dispatcher(object):
+    def __init__(self):
+        self.sent = []
+
+    def submit(self, channel, message):
+        self.sent.append((channel, message))
+        return True
+
+
+def test_reports_across_windows_stay_one_incident(monkeypatch):
+    clock = [datetime(2024, 1, 1, 12, 0, 0)]
+
+    class Clock(datetime):
+        @classmethod
+        def utcnow(cls):
+            return clock[0]
+
+    monkeypatch.setattr(incidents, "datetime", Clock)
+    dispatcher = Dispatcher()
+    coalescer = incidents.IncidentCoalescer(mongomock.MongoClient().db.incidents, dispatcher, windowSeconds=600.0)
+
+    # a report every 5 minutes for 40 minutes, four windows of 10 minutes
+    ids = set()
+    for _ in range(9):
+        ids.add(coalescer.record("sos", 27.7, 85.3, severity=80, recipient=("email", "alerts@example.com")))
+        clock[0] += timedelta(minutes=5)
+
+    assert len(ids) == 1
+    assert coalescer.stats()["incidents"] == 1
+    assert coalescer.stats()["immediate"] == 1
+    assert len(dispatcher.sent) == 1
+
+
+def test_quiet_window_opens_a_new_incident(monkeypatch):
+    clock = [datetime(2024, 1, 1, 12, 0, 0)]
+
+    class Clock(datetime):
+        @classmethod
+        def utcnow(cls):
+            return clock[0]
+
+    monkeypatch.setattr(incidents, "datetime", Clock)
+    dispatcher = Dispatcher()
+    coalescer = incidents.IncidentCoalescer(mongomock.MongoClient().db.incidents, dispatcher, windowSeconds=600.0)
+
+    first = coalescer.record("sos", 27.7, 85.3, recipient=("email", "alerts@example.com"))
+    clock[0] += timedelta(minutes=11)
+    second = coalescer.record("sos", 27.7, 85.3, recipient=("email", "alerts@example.com"))
+
+    assert first != second
+    assert len(dispatcher.sent) == 2